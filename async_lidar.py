@@ -0,0 +1,277 @@
+import time
+import asyncio
+import argparse
+from collections import deque
+import numpy as np
+import serial
+from PySide6 import QtCore
+from scan_decoder import ScanDecoder, PACKET_SIZE
+from revolution_buffer import RevolutionBuffer
+from lidar_stats import AcquisitionStats
+
+SYNC_BYTE = 0xA5
+DESCRIPTOR_SYNC = bytes([0xA5, 0x5A])
+DESCRIPTOR_SIZE = 7
+CMD_STOP = 0x25
+CMD_FORCE_SCAN = 0x21
+CMD_SET_PWM = 0xF0
+
+
+def command(cmd, payload=b''):
+    '''RPLidar request packet, commands with a payload carry a size and checksum'''
+    if not payload:
+        return bytes([SYNC_BYTE, cmd])
+    data = bytes([SYNC_BYTE, cmd, len(payload)]) + payload
+    checksum = 0
+    for byte in data:
+        checksum ^= byte
+    return data + bytes([checksum])
+
+
+class RevolutionQueue:
+    '''Bounded queue between the reader and its consumer. When the consumer falls
+    behind the oldest revolution is dropped, so latency never grows past
+    maxsize revolutions.'''
+
+    def __init__(self, maxsize=2):
+        self.items = deque(maxlen=maxsize)
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def put(self, scan):
+        if len(self.items) == self.items.maxlen:
+            self.dropped += 1
+        self.items.append(scan)
+        self._ready.set()
+
+    async def get(self):
+        '''Next revolution, or None once the reader has stopped'''
+        while not self.items:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self.items.popleft()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class AsyncLidarReader:
+    '''Lidar acquisition on asyncio with non-blocking serial reads.
+
+    Bytes are pulled off the port whenever it is readable and decoded as soon
+    as whole packets are buffered, so cancelling run() takes effect at once,
+    even in the middle of a revolution. The partial revolution is discarded and
+    the device is stopped on the way out.'''
+
+    def __init__(self, port, baudrate, batch_size=128, queue_size=2, pwm=660, held_slots=1):
+        self.port = port
+        self.baudrate = baudrate
+        self.batch_size = batch_size
+        self.pwm = pwm
+        self.decoder = ScanDecoder(batch_size)
+        '''One slot per queued revolution, per revolution the consumer still holds
+        (held_slots) and for the one being filled, so no live scan is overwritten'''
+        self.revolutions = RevolutionBuffer(slots=queue_size + held_slots + 1)
+        self.queue = RevolutionQueue(queue_size)
+        self.stats = AcquisitionStats()
+        self.serial = None
+        self._buffer = bytearray()
+        self._data = asyncio.Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            self.serial = serial.Serial(self.port, self.baudrate, timeout=0)
+            loop.add_reader(self.serial.fileno(), self._on_readable)
+            self.serial.write(command(CMD_SET_PWM, self.pwm.to_bytes(2, 'little')))
+            self.serial.write(command(CMD_FORCE_SCAN))
+            descriptor = await self._read(DESCRIPTOR_SIZE)
+            if descriptor[:2] != DESCRIPTOR_SYNC:
+                raise IOError(f"Unexpected scan descriptor {descriptor.hex()}")
+
+            while True:
+                await self._wait_for(PACKET_SIZE)
+                self._decode_available()
+        finally:
+            '''Close the queue even when the port never opened, the consumer waits on it'''
+            if self.serial is not None:
+                loop.remove_reader(self.serial.fileno())
+                try:
+                    self.serial.write(command(CMD_STOP))
+                    self.serial.write(command(CMD_SET_PWM, (0).to_bytes(2, 'little')))
+                except serial.SerialException:
+                    pass
+                self.serial.close()
+            self.queue.close()
+
+    def _decode_available(self):
+        size = min(len(self._buffer) // PACKET_SIZE, self.batch_size) * PACKET_SIZE
+        start = time.perf_counter()
+        with memoryview(self._buffer) as view:
+            n = self.decoder.decode(view[:size])
+        self.decoder.decode_time = time.perf_counter() - start
+        del self._buffer[:size]
+        if self.decoder.misaligned():
+            self.decoder.desync_count += 1
+            del self._buffer[:1]
+
+        self.stats.record_batch(n, n - int(np.count_nonzero(self.decoder.distance_q2[:n])), self.decoder.decode_time)
+        self.stats.desyncs = self.decoder.desync_count
+        self.stats.overflows = self.revolutions.overflow_count
+        for slot in self.revolutions.push(self.decoder, time.monotonic()):
+            self.stats.record_revolution(self.revolutions.timestamps[slot])
+            self.queue.put(self.revolutions.scan(slot))
+        self.stats.dropped = self.queue.dropped
+
+    def _on_readable(self):
+        data = self.serial.read(self.serial.in_waiting or 1)
+        if data:
+            self._buffer += data
+            self._data.set()
+
+    async def _wait_for(self, size):
+        while len(self._buffer) < size:
+            self._data.clear()
+            await self._data.wait()
+
+    async def _read(self, size):
+        await self._wait_for(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class AsyncLidarThread(QtCore.QThread):
+    '''Runs an AsyncLidarReader on its own event loop and emits new_data like
+    LidarThread. stop() cancels the reader wherever it is.
+
+    At most max_in_flight revolutions are emitted and not yet handed back
+    through consumed(). Signals to another thread queue up without bound, so
+    a slow consumer would otherwise only add latency; this way revolutions
+    wait in the reader's queue, where the oldest are dropped. held_slots is
+    how many revolutions the consumer keeps after consuming them, the scan
+    pool is sized to cover those too.'''
+    new_data = QtCore.Signal(object)
+
+    def __init__(self, port, baudrate, queue_size=2, held_slots=0, max_in_flight=1):
+        super().__init__()
+        self.max_in_flight = max_in_flight
+        self.reader = AsyncLidarReader(port, baudrate, queue_size=queue_size, held_slots=held_slots + max_in_flight)
+        self.stats = self.reader.stats
+        self.stop_flag = False
+        self.error = None
+        self.loop = None
+        self.task = None
+        self.in_flight = 0
+        self._consumed = None
+
+    def run(self):
+        asyncio.run(self.main())
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self._consumed = asyncio.Event()
+        self.task = asyncio.create_task(self.reader.run())
+        self.task.add_done_callback(lambda task: self._consumed.set())
+        if self.stop_flag:
+            self.task.cancel()
+        while True:
+            '''Take the next revolution only once the consumer has room, so it is the freshest one'''
+            while self.in_flight >= self.max_in_flight and not self.task.done():
+                self._consumed.clear()
+                await self._consumed.wait()
+            scan = await self.reader.queue.get()
+            if scan is None:
+                break
+            self.in_flight += 1
+            self.new_data.emit(scan)
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        except Exception as error:
+            self.error = error
+            print(f"Lidar reader stopped: {error}")
+
+    def consumed(self):
+        '''Called by the consumer, from any thread, once it is done handling a new_data scan'''
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._on_consumed)
+            except RuntimeError:
+                '''The reader has stopped and its event loop is closed'''
+                pass
+
+    def _on_consumed(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._consumed.set()
+
+    def _on_stop(self):
+        self.task.cancel()
+        self._consumed.set()
+
+    def stop(self):
+        self.stop_flag = True
+        if self.loop is not None and self.task is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._on_stop)
+            except RuntimeError:
+                '''The event loop has already finished'''
+                pass
+        self.wait()
+
+
+async def headless(port, baudrate, duration):
+    '''Read without Qt and print the acquisition counters once a second.
+    Returns the reader so callers can check its counters afterwards.'''
+    reader = AsyncLidarReader(port, baudrate)
+    task = asyncio.create_task(reader.run())
+
+    async def consume():
+        while await reader.queue.get() is not None:
+            pass
+
+    consumer = asyncio.create_task(consume())
+    start = time.monotonic()
+    try:
+        while not task.done() and (duration <= 0 or time.monotonic() - start < duration):
+            await asyncio.sleep(1)
+            stats = reader.stats.snapshot()
+            print(f"{stats['samples_per_s']:8.0f} samples/s  {stats['revolutions_per_s']:5.1f} rev/s  "
+                  f"jitter {stats['period_jitter'] * 1000:.2f} ms  dropped {stats['dropped']}")
+    finally:
+        task.cancel()
+        error, _ = await asyncio.gather(task, consumer, return_exceptions=True)
+        if isinstance(error, Exception):
+            print(f"Lidar reader stopped: {error}")
+    return reader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Headless asyncio lidar reader')
+    parser.add_argument("--port", help="Serial port of the lidar.", type=str, default=None)
+    parser.add_argument("--baudrate", type=int, default=256000)
+    parser.add_argument("--fake", help="Read from a pseudo-terminal stand-in device.", action='store_true')
+    parser.add_argument("--duration", help="Seconds to run, 0 runs until interrupted.", type=float, default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    device = None
+    port = args.port
+    if args.fake or port is None:
+        from fake_rplidar import FakeRPLidar
+        device = FakeRPLidar().start()
+        port = device.port
+    try:
+        asyncio.run(headless(port, args.baudrate, args.duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if device is not None:
+            device.close()
@@ -0,0 +1,52 @@
+class DetectionCadence:
+    '''Decides which frames go through the detector and which are filled in by
+    the tracker.
+
+    The interval adapts to the measured cost of both kinds of frame: with
+    detector frames taking T_d and tracker frames T_t, detecting every N frames
+    averages (T_d + (N - 1) * T_t) / N per frame, and N is the smallest value
+    that keeps that under 1 / target_fps. A detector frame is also forced as
+    soon as the tracker loses confidence, and for as long as it holds new
+    tracks that need more detections before they are shown.'''
+
+    def __init__(self, target_fps, max_interval=10, min_confidence=0.5, smoothing=0.2):
+        self.target_fps = target_fps
+        self.max_interval = max_interval
+        self.min_confidence = min_confidence
+        self.smoothing = smoothing
+        self.interval = 1
+        self.detect_time = None
+        self.track_time = None
+        self.since_detection = 0
+        self.detections = 0
+        self.predictions = 0
+
+    def due(self, confidence=1.0, tentative=0):
+        return self.since_detection + 1 >= self.interval or confidence < self.min_confidence or tentative > 0
+
+    def record(self, detected, seconds):
+        '''Account one processed frame and how long it took'''
+        if detected:
+            self.detections += 1
+            self.since_detection = 0
+            self.detect_time = self._average(self.detect_time, seconds)
+        else:
+            self.predictions += 1
+            self.since_detection += 1
+            self.track_time = self._average(self.track_time, seconds)
+        self.interval = self._interval()
+
+    def _average(self, current, sample):
+        return sample if current is None else current + self.smoothing * (sample - current)
+
+    def _interval(self):
+        if self.detect_time is None:
+            return 1
+        budget = 1.0 / self.target_fps
+        if self.detect_time <= budget:
+            return 1
+        track_time = self.track_time or 0.0
+        if track_time >= budget:
+            return self.max_interval
+        needed = (self.detect_time - track_time) / (budget - track_time)
+        return max(1, min(self.max_interval, int(-(-needed // 1))))
@@ -0,0 +1,63 @@
+import os
+import hashlib
+import numpy as np
+from scan_decoder import ANGLE_Q6_SCALE
+
+CACHE_VERSION = 1
+
+
+class CameraModel:
+    '''Pinhole mapping between image columns and bearings relative to the
+    camera axis (degrees, negative to the left).
+
+    Both directions are lookup tables built once: bearing of every column edge
+    0..image_width, and column of every bearing across the FOV at the lidar's
+    1/64 degree resolution. Mapping is then an array index. The tables are
+    cached in cache_dir (when given) under a name derived from the parameters
+    they were built from, so changing the config rebuilds them.
+
+    The focal length in pixels comes from the horizontal FOV, or from the lens
+    focal length and sensor width with from_intrinsics().'''
+
+    def __init__(self, image_width, fov, cache_dir=None):
+        self.image_width = image_width
+        self.fov = fov
+        self.focal_px = (image_width / 2) / np.tan(np.radians(fov / 2))
+        self.half_range = int(np.ceil(fov / 2 * ANGLE_Q6_SCALE))
+
+        path = self.cache_path(cache_dir) if cache_dir else None
+        if path and os.path.exists(path):
+            with np.load(path) as tables:
+                self.column_bearing = tables['column_bearing']
+                self.bearing_column = tables['bearing_column']
+        else:
+            self.build()
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(path, column_bearing=self.column_bearing, bearing_column=self.bearing_column)
+
+    @classmethod
+    def from_intrinsics(cls, image_width, focal_length, sensor_width, cache_dir=None):
+        '''Camera model from the lens focal length and sensor width (same unit)'''
+        fov = np.degrees(2 * np.arctan(sensor_width / (2 * focal_length)))
+        return cls(image_width, fov, cache_dir)
+
+    def cache_path(self, cache_dir):
+        key = f"{CACHE_VERSION}:{self.image_width}:{self.fov!r}:{ANGLE_Q6_SCALE!r}"
+        return os.path.join(cache_dir, f"camera_{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz")
+
+    def build(self):
+        columns = np.arange(self.image_width + 1, dtype=float)
+        self.column_bearing = np.degrees(np.arctan((columns - self.image_width / 2) / self.focal_px))
+        bearings = np.arange(-self.half_range, self.half_range + 1) / ANGLE_Q6_SCALE
+        self.bearing_column = self.image_width / 2 + self.focal_px * np.tan(np.radians(bearings))
+
+    def bearing(self, columns):
+        '''Bearing of image columns, clipped to the image'''
+        index = np.clip(np.rint(columns), 0, self.image_width).astype(np.intp)
+        return self.column_bearing[index]
+
+    def column(self, bearings):
+        '''Image column of bearings, bearings outside the FOV are clipped to the image edges'''
+        index = np.clip(np.rint(np.asarray(bearings) * ANGLE_Q6_SCALE), -self.half_range, self.half_range)
+        return self.bearing_column[index.astype(np.intp) + self.half_range]
@@ -1,25 +1,125 @@
 from PySide6 import QtCore
 import cv2 as cv
 import numpy as np
-from ultralytics import YOLO
 import cvzone
 import time
 import math
+from concurrent.futures import CancelledError
 from config import LIDAR_BAUDRATE, LIDAR_PORT, YOLO_MODEL_PATH, CLASS_NAMES, CAMERA_FOV_H, CAMERA_RESOLUTION_WIDTH, CAMERA_RESOLUTION_HEIGHT, NUM_SEGMENTS
+from config import LIDAR_RECORD_PATH, LIDAR_REPLAY_PATH, LIDAR_REPLAY_SPEED, LIDAR_MOUNT_YAW
+from config import LIDAR_BACKEND, LIDAR_QUEUE_SIZE, CAMERA_DEVICE, CAMERA_BUFFER_SLOTS, CAMERA_PACING
+from config import INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT, YOLO_INPUT_SIZE, DISPLAY_WIDTH, DISPLAY_HEIGHT
+from config import DETECTOR_BACKEND, DETECTOR_CACHE_DIR, DETECTOR_WARMUP_RUNS
+from config import DETECTOR_CONFIDENCE, DETECTOR_CLASSES, DETECTOR_MAX_DET
+from config import LIDAR_SYNC_SLOTS, LIDAR_SYNC_INTERPOLATE
+from config import OBSTACLE_SEGMENTATION, OBSTACLE_MAX_ANGLE_GAP, OBSTACLE_JUMP_DISTANCE, OBSTACLE_JUMP_RATIO, OBSTACLE_MIN_POINTS
+from config import FUSION_PERCENTILE, CAMERA_MODEL, CAMERA_MODEL_CACHE_DIR, CAMERA_FOCAL_LENGTH, CAMERA_SENSOR_WIDTH
+from config import ROI_MODE, ROI_DISTANCE_THRESHOLD, ROI_MARGIN
+from config import TRACKING_MODE, TARGET_FPS, DETECTION_MAX_INTERVAL, TRACK_MIN_CONFIDENCE, TRACK_MAX_AGE, TRACK_MIN_HITS
+from config import TRACK_FUSED_RANGE, TRACK_RANGE_GATE
+from config import LIDAR_FILTER_DEPTH, LIDAR_FILTER_MODE, LIDAR_FILTER_BINS, LIDAR_FILTER_ALPHA
 from lidar_thread import LidarThread
+from scan_log import ReplayLidarSource
+from async_lidar import AsyncLidarThread
+from frame_grabber import FrameGrabber
+from inference_service import InferenceService
+from detector import Detector
+from preprocess import Letterbox, DisplayScaler
+from roi import RoiPlanner
+from cadence import DetectionCadence
+from sort import Sort
+from overlay import OverlayRenderer
+from fusion import RangeFusion
+from camera_model import CameraModel
+from sector_engine import SectorEngine, SectorLayout, SectorStats
+from scan_sync import ScanSync
+from obstacles import ObstacleSegmenter
+from temporal_filter import TemporalFilter
 
 class CameraThread(QtCore.QThread):
     new_frame = QtCore.Signal(np.ndarray)
-    new_lidar_data = QtCore.Signal(np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+    new_lidar_data = QtCore.Signal(object)
+    new_sector_stats = QtCore.Signal(object)
+    new_obstacles = QtCore.Signal(object)
     
-    def __init__(self):
+    def __init__(self, device=CAMERA_DEVICE, inference=None):
         super().__init__()
         self.stop_flag = False
-        self.model = YOLO(YOLO_MODEL_PATH)
-        self.lidar_thread = LidarThread(port=LIDAR_PORT, baudrate=LIDAR_BAUDRATE)
+
+        '''Several cameras can share one InferenceService, the thread that creates it owns it'''
+        self.owns_inference = inference is None
+        if inference is None:
+            '''The detector is only constructed here, the InferenceService thread loads it'''
+            detector = Detector(YOLO_MODEL_PATH, DETECTOR_BACKEND, YOLO_INPUT_SIZE, DETECTOR_CACHE_DIR,
+                                DETECTOR_WARMUP_RUNS, conf=DETECTOR_CONFIDENCE, classes=DETECTOR_CLASSES,
+                                max_det=DETECTOR_MAX_DET)
+            inference = InferenceService(detector, max_batch_size=INFERENCE_MAX_BATCH, max_wait=INFERENCE_MAX_WAIT)
+        self.inference = inference
+        self.inference.register_source()
+        if LIDAR_REPLAY_PATH:
+            self.lidar_thread = ReplayLidarSource(LIDAR_REPLAY_PATH, speed=LIDAR_REPLAY_SPEED)
+        elif LIDAR_BACKEND == 'async':
+            self.lidar_thread = AsyncLidarThread(port=LIDAR_PORT, baudrate=LIDAR_BAUDRATE, queue_size=LIDAR_QUEUE_SIZE,
+                                                 held_slots=LIDAR_SYNC_SLOTS)
+            '''Queued, in flight, matched by ScanSync and being filled: none of them may share a pool slot'''
+            assert self.lidar_thread.reader.revolutions.slots >= \
+                LIDAR_QUEUE_SIZE + LIDAR_SYNC_SLOTS + self.lidar_thread.max_in_flight + 1
+        else:
+            self.lidar_thread = LidarThread(port=LIDAR_PORT, baudrate=LIDAR_BAUDRATE, record_path=LIDAR_RECORD_PATH)
         self.lidar_thread.new_data.connect(self.handle_lidar_data)
+        self.grabber = FrameGrabber(device, slots=CAMERA_BUFFER_SLOTS, pacing=CAMERA_PACING)
+        self.letterbox = Letterbox(YOLO_INPUT_SIZE)
+        self.display_scaler = DisplayScaler(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        self.overlay = OverlayRenderer(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+        self.overlay_stats = None
+        self.latency = 0.0
+        self.dropped_frames = 0
         self.lidar_data = None
-        self.distance_values = [None] * 12
+        self.temporal_filter = None
+        if LIDAR_FILTER_DEPTH > 0:
+            self.temporal_filter = TemporalFilter(depth=LIDAR_FILTER_DEPTH, bins=LIDAR_FILTER_BINS,
+                                                  mode=LIDAR_FILTER_MODE, alpha=LIDAR_FILTER_ALPHA)
+        if CAMERA_MODEL == 'intrinsics':
+            self.camera_model = CameraModel.from_intrinsics(CAMERA_RESOLUTION_WIDTH, CAMERA_FOCAL_LENGTH,
+                                                            CAMERA_SENSOR_WIDTH, CAMERA_MODEL_CACHE_DIR)
+        else:
+            self.camera_model = CameraModel(CAMERA_RESOLUTION_WIDTH, CAMERA_FOV_H, CAMERA_MODEL_CACHE_DIR)
+        self.sector_layout = SectorLayout(self.camera_model.fov, NUM_SEGMENTS, LIDAR_MOUNT_YAW)
+        self.sector_engine = SectorEngine(self.sector_layout)
+        self.sector_stats = None
+        self.distance_values = [None] * self.sector_engine.num_sectors
+
+        '''Frames use the lidar data matched to their capture time, not the latest revolution'''
+        self.scan_sync = ScanSync(LIDAR_SYNC_SLOTS)
+        self.interpolated_stats = SectorStats(self.sector_engine.num_sectors)
+        self.frame_scan = None
+        self.frame_stats = None
+        self.frame_time = None
+        self.frame_dt = 0.0
+        self.skew = float('nan')
+        self.obstacle_segmenter = None
+        self.obstacles = None
+        if OBSTACLE_SEGMENTATION:
+            self.obstacle_segmenter = ObstacleSegmenter(OBSTACLE_MAX_ANGLE_GAP, OBSTACLE_JUMP_DISTANCE,
+                                                        OBSTACLE_JUMP_RATIO, OBSTACLE_MIN_POINTS)
+        self.fusion = RangeFusion(self.sector_layout, self.camera_model, FUSION_PERCENTILE)
+
+        self.detector_error = None
+        self.roi_planner = None
+        self.roi_skipped = 0
+        if ROI_MODE:
+            self.roi_planner = RoiPlanner(self.sector_layout, self.camera_model, ROI_DISTANCE_THRESHOLD, ROI_MARGIN)
+            '''Each band keeps its own letterbox buffer, added the first time that many bands
+            are seen; merged bands never exceed (NUM_SEGMENTS + 1) // 2'''
+            self.roi_letterboxes = []
+
+        self.tracker = None
+        self.cadence = None
+        if TRACKING_MODE:
+            self.tracker = Sort(max_age=TRACK_MAX_AGE, min_hits=TRACK_MIN_HITS, fused=TRACK_FUSED_RANGE,
+                                range_gate=TRACK_RANGE_GATE)
+            self.cadence = DetectionCadence(TARGET_FPS, DETECTION_MAX_INTERVAL, TRACK_MIN_CONFIDENCE)
+
         self.distance_color_map = [
             (0, (0, 0, 0)),          # Red
             (30, (0, 0, 255)),         # Red
@@ -34,99 +134,221 @@ class CameraThread(QtCore.QThread):
             (390, (0, 255, 0))         # Green
         ]
 
+        '''The sector bar layer is drawn first so the center circle stays on top'''
+        self.overlay.layer('sectors')
+        self.draw_center(self.overlay.layer('center'))
+
     def run(self):
         self.lidar_thread.start()
-        cap = cv.VideoCapture(0)
-        if not cap.isOpened():
-            print("Couldn't open Camera")
+        if self.owns_inference:
+            self.inference.start()
+        self.grabber.start()
+        self.grabber.opened.wait()
+        if self.grabber.failed:
             return
 
         pTime = 0
         while not self.stop_flag:
-            ret, frame = cap.read()
-            if ret:
-                frame = self.process_frame(frame)
-                self.draw_distance_boxes(frame)
+            latest = self.grabber.buffer.get(timeout=1.0)
+            if latest is not None:
+                frame, captured_at = latest
+                self.sync_lidar(captured_at)
+                previous_time = self.frame_time
+                self.frame_dt = captured_at - previous_time if previous_time is not None else 0.0
+                self.frame_time = captured_at
+                display = self.process_frame(frame)
+                self.grabber.release(frame)
+                if display is None:
+                    '''The GUI has not painted any of the previous frames yet. The tracker did not
+                    advance either, so the next frame's dt spans this one too'''
+                    self.frame_time = previous_time
+                    continue
+                frame = display  # Display sized from here on, released by the GUI once painted
 
-                # Draw center circle
-                center_x = frame.shape[1] // 2
-                center_y = frame.shape[0] // 2
-                cv.circle(frame, (center_x, center_y), 10, (255, 0, 0), -1)
+                # Sector bar and center circle, the bar is redrawn only when the matched lidar data changes
+                stats = self.frame_stats
+                if stats is not None and (stats is not self.overlay_stats or stats is self.interpolated_stats):
+                    self.overlay_stats = stats
+                    self.draw_distance_boxes(self.overlay.layer('sectors'), stats.distance_values())
+                self.overlay.blend(frame)
 
                 # Calculate and display FPS
                 cTime = time.time()
                 fps = 1 / (cTime - pTime)
                 pTime = cTime
                 cv.putText(frame, f"FPS: {int(fps)}", (10, 30), cv.FONT_HERSHEY_SIMPLEX, 1, (10, 10, 10), 4)
+
+                # Capture to display latency and frames skipped while inference was running
+                self.latency = time.monotonic() - captured_at
+                self.dropped_frames = self.grabber.buffer.dropped
+                skew = '-' if np.isnan(self.skew) else f"{int(self.skew * 1000)} ms"
+                cv.putText(frame, f"Latency: {int(self.latency * 1000)} ms  Dropped: {self.dropped_frames}  Skew: {skew}",
+                           (10, 65), cv.FONT_HERSHEY_SIMPLEX, 0.7, (10, 10, 10), 2)
+                if self.cadence is not None:
+                    cv.putText(frame, f"Detect every {self.cadence.interval}", (10, 95),
+                               cv.FONT_HERSHEY_SIMPLEX, 0.7, (10, 10, 10), 2)
                 self.new_frame.emit(frame)
-            else:
-                print("Failed to read from camera")
+            elif self.grabber.buffer.closed:
                 break
 
-        cap.release()
-
     def process_frame(self, frame):
-        results = self.model(frame, stream=True)
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                conf = math.ceil((box.conf[0] * 100)) / 100
-                cls = int(box.cls[0])
-                if conf > 0.5:
-                    self.draw_box(frame, x1, y1, x2, y2, cls, conf)
-        return frame
-
-    def draw_box(self, frame, x1, y1, x2, y2, cls, conf):
+        '''Detect on a letterboxed copy at model size and draw on a display sized copy,
+        the full resolution frame is only read by cv.resize'''
+        start = time.perf_counter()
+        '''Take the display buffer first, a frame the GUI has no room for is not worth detecting on'''
+        display = self.display_scaler(frame, timeout=1.0)
+        if display is None:
+            return None
+
+        detected = self.cadence is None or self.cadence.due(self.tracker.match_ratio, self.tracker.tentative)
+        if detected:
+            detections = self.run_detector(frame)
+            if self.tracker is not None:
+                detections = self.track(detections, frame.shape[1])
+        else:
+            detections = self.track(None, frame.shape[1])
+
+        if detections.shape[1] > 7:
+            ranges, rates = detections[:, 7], detections[:, 8]
+        else:
+            ranges = self.object_ranges(detections, frame.shape[1])
+            rates = np.full(len(detections), np.nan)
+        for box, distance, rate in zip(detections, ranges, rates):
+            x1, y1, x2, y2 = self.display_scaler.to_display(*box[:4])
+            conf = math.ceil(box[4] * 100) / 100
+            track_id = int(box[6]) if len(box) > 6 else None
+            self.draw_box(display, x1, y1, x2, y2, int(box[5]), conf, track_id, distance, rate)
+        if self.cadence is not None:
+            self.cadence.record(detected, time.perf_counter() - start)
+        return display
+
+    def object_ranges(self, detections, image_width):
+        '''Lidar range in cm of every detection from its column span, NaN when unknown'''
+        scan = self.frame_scan
+        if scan is None:
+            return np.full(len(detections), np.nan)
+        self.fusion.prepare(scan)
+        return self.fusion.ranges(detections[:, 0], detections[:, 2], image_width)
+
+    def run_detector(self, frame):
+        '''Detections of a frame, none when the detector failed so the video keeps running'''
+        try:
+            if self.roi_planner is not None and self.frame_stats is not None:
+                return self.detect_roi(frame)
+            return self.detect(frame)
+        except CancelledError:
+            '''The InferenceService stopped with the request still queued'''
+            return np.empty((0, 6), dtype=np.float32)
+        except Exception as error:
+            if self.detector_error is None:
+                print(f"Couldn't run detector: {error}")
+            self.detector_error = error
+            return np.empty((0, 6), dtype=np.float32)
+
+    def track(self, detections, image_width):
+        '''Feed detections to SORT, or only advance its tracks when detections is None.
+        Returns an (N, 7) array, the detection columns followed by the track ID; confidence
+        and class are those of each track's last detection. A fused tracker also gets the
+        lidar range of every box and adds its filtered range and range rate (N, 9).'''
+        fused = self.tracker.fused
+        if detections is None:
+            tracks = self.tracker.predict(self.frame_dt)
+            if fused:
+                self.tracker.update_ranges(tracks[:, 4], self.object_ranges(tracks, image_width))
+        elif fused:
+            tracks = self.tracker.update(detections, self.object_ranges(detections, image_width), self.frame_dt)
+        else:
+            tracks = self.tracker.update(detections)
+        if len(tracks) == 0:
+            return np.empty((0, 9 if fused else 7))
+
+        trackers = {trk.id + 1: trk for trk in self.tracker.trackers}
+        matched = [trackers[int(track_id)] for track_id in tracks[:, 4]]
+        columns = [tracks[:, :4], np.array([trk.detection[4:6] for trk in matched]), tracks[:, 4]]
+        if fused:
+            columns += [[trk.range for trk in matched], [trk.range_rate for trk in matched]]
+        return np.column_stack(columns)
+
+    def detect(self, frame):
+        result = self.inference.submit(self.letterbox(frame)).result()
+        return self.read_detections(result, self.letterbox)
+
+    def detect_roi(self, frame):
+        '''Run the model only on the column bands where the lidar sees something close,
+        and not at all when it sees nothing'''
+        bands = self.roi_planner.bands(self.frame_stats, frame.shape[1])
+        if not bands:
+            self.roi_skipped += 1
+            return np.empty((0, 6), dtype=np.float32)
+
+        while len(self.roi_letterboxes) < len(bands):
+            self.roi_letterboxes.append(Letterbox(YOLO_INPUT_SIZE))
+        pending = []
+        for (x0, x1), letterbox in zip(bands, self.roi_letterboxes):
+            pending.append((self.inference.submit(letterbox(frame[:, x0:x1])), letterbox, x0))
+        return np.concatenate([self.read_detections(future.result(), letterbox, x0)
+                               for future, letterbox, x0 in pending])
+
+    def read_detections(self, detections, letterbox, offset_x=0):
+        '''Detector rows (x1, y1, x2, y2, confidence, class) mapped in place to full resolution pixels,
+        confidence, class and count are already filtered by the detector'''
+        letterbox.map_boxes(detections)
+        detections[:, [0, 2]] += offset_x
+        return detections
+
+    def draw_box(self, frame, x1, y1, x2, y2, cls, conf, track_id=None, distance=np.nan, rate=np.nan):
         color = (0, 255, 0)
-        cvzone.putTextRect(frame, f'{CLASS_NAMES[cls]} {conf}', 
+        label = f'{CLASS_NAMES[cls]} {conf}' if track_id is None else f'{CLASS_NAMES[cls]} #{track_id} {conf}'
+        if not np.isnan(distance):
+            label += f' {distance:.0f} cm'
+        if not np.isnan(rate):
+            label += f' {rate:+.0f} cm/s'
+        cvzone.putTextRect(frame, label, 
                            (max(0, x1), max(35, y1)), scale=2, thickness=2,
                            colorB=color, colorT=(0, 0, 0), colorR=color, offset=5)
         cv.rectangle(frame, (x1, y1), (x2, y2), color, 3)
         center_x_box, center_y_box = (x1 + x2) // 2, (y1 + y2) // 2
         cv.circle(frame, (center_x_box, center_y_box), 5, color, -1)
 
+    def sync_lidar(self, timestamp):
+        '''Select the lidar data for a frame captured at timestamp: the nearest revolution, or with
+        LIDAR_SYNC_INTERPOLATE the sector stats interpolated between the revolutions either side'''
+        before, after, weight, self.skew = self.scan_sync.pair(timestamp)
+        nearest = before if after is None or (before is not None and weight <= 0.5) else after
+        if nearest is None:
+            return
+        self.frame_scan, self.frame_stats = nearest
+        if LIDAR_SYNC_INTERPOLATE and before is not None and after is not None:
+            self.frame_stats = self.interpolated_stats.interpolate(before[1], after[1], weight)
+
     def process_lidar_data(self):
         if self.lidar_data is None:
             return
 
-        x, y, distances, angles = self.lidar_data
-        transformed_angles = np.where(angles > 309, angles - 360, angles)
-        filtered_mask = (angles > 309) | (angles < 51)
-        filtered_angles = transformed_angles[filtered_mask]
-
-        target_angles = [310, 320, 330, 340, 350, 360, 0, 10, 20, 30, 40, 50]
-        for i, angle_target in enumerate(target_angles):
-            valid_x, valid_y, valid_distances = [], [], []
-            for j, angle in enumerate(angles):
-                if angle_target - 5 <= angle < angle_target + 5 or (angle_target == 360 and 355 <= angle < 360) or (angle_target == 0 and 0 <= angle < 5):
-                    valid_x.append(x[j])
-                    valid_y.append(y[j])
-                    valid_distances.append(distances[j])
-
-            if valid_distances:
-                min_distance_index = valid_distances.index(min(valid_distances))
-                closest_distance = valid_distances[min_distance_index]
-                self.distance_values[i] = closest_distance
-            else:
-                self.distance_values[i] = None
-
-        print("Distance Values: ", self.distance_values)
-
-    def draw_distance_boxes(self, frame):
+        self.sector_stats = self.sector_engine.reduce(self.lidar_data)
+        self.distance_values = self.sector_stats.distance_values()
+
+    def draw_center(self, layer):
+        center_x = layer.shape[1] // 2
+        center_y = layer.shape[0] // 2
+        cv.circle(layer, (center_x, center_y), 10, (255, 0, 0, 255), -1)
+
+    def draw_distance_boxes(self, layer, distance_values):
+        '''Sector bar on a BGRA overlay layer, each box spans the image columns of its sector's bearings'''
         box_height = 50
-        y_start = frame.shape[0] - box_height
-        segments = frame.shape[1] / 11
+        y_start = layer.shape[0] - box_height
+        columns = self.camera_model.column(self.sector_layout.relative_edges)
+        x_edges = np.rint(columns * (layer.shape[1] / self.camera_model.image_width)).astype(int).tolist()
 
-        for i in range(11):
-            x_start = int(segments * i)
-            x_end = int(segments * (i + 1))
+        for i in range(len(distance_values)):
+            x_start = x_edges[i]
+            x_end = x_edges[i + 1]
             
-            if self.distance_values[i] is not None:
-                color = self.get_color(self.distance_values[i])
-                cv.rectangle(frame, (x_start, y_start), (x_end, frame.shape[0]), color, -1)  # Filled rectangle
-                cv.rectangle(frame, (x_start, y_start), (x_end, frame.shape[0]), (255, 255, 255), 2)  # White outline
-                cv.putText(frame, f"{self.distance_values[i]:.2f}", (x_start + 5, y_start + 30), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            if distance_values[i] is not None:
+                color = self.get_color(distance_values[i]) + (255,)
+                cv.rectangle(layer, (x_start, y_start), (x_end, layer.shape[0]), color, -1)  # Filled rectangle
+                cv.rectangle(layer, (x_start, y_start), (x_end, layer.shape[0]), (255, 255, 255, 255), 2)  # White outline
+                cv.putText(layer, f"{distance_values[i]:.2f}", (x_start + 5, y_start + 30), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255, 255), 1)
 
     def get_color(self, distance):
         for threshold, color in self.distance_color_map:
@@ -134,12 +356,27 @@ class CameraThread(QtCore.QThread):
                 return color
         return self.distance_color_map[-1][1]  # Return the last color if distance exceeds all thresholds
 
-    def handle_lidar_data(self, x, y, distances, angles):
-        self.lidar_data = (x, y, distances, angles)
+    def handle_lidar_data(self, scan):
+        '''The scan is forwarded as the same object, nothing is copied on the way to the plots'''
+        self.lidar_thread.stats.record_emit_latency(time.monotonic() - scan.timestamp)
+        '''Frames are paired on the middle of the sweep, scan.timestamp is when its last sample was read'''
+        sweep_time = float(scan.sample_time.mean()) if len(scan) else scan.timestamp
+        if self.temporal_filter is not None:
+            scan = self.temporal_filter.update(scan)
+        self.lidar_data = scan
         self.process_lidar_data()
-        self.new_lidar_data.emit(x, y, distances, angles)
+        self.scan_sync.put(sweep_time, (scan, self.sector_stats))
+        self.new_lidar_data.emit(scan)
+        self.new_sector_stats.emit(self.sector_stats)
+        if self.obstacle_segmenter is not None:
+            self.obstacles = self.obstacle_segmenter.segment(scan)
+            self.new_obstacles.emit(self.obstacles)
+        self.lidar_thread.consumed()
 
     def stop(self):
         self.stop_flag = True
+        self.grabber.stop()
         self.lidar_thread.stop()
-        self.wait()
\ No newline at end of file
+        self.wait()
+        if self.owns_inference:
+            self.inference.stop()
\ No newline at end of file
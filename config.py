@@ -1,4 +1,5 @@
 # config.py
+import os
 
 # Camera Configuration
 CAMERA_FOV_H = 102  # Horizontal Field of View in degrees
@@ -7,14 +8,60 @@ CAMERA_RESOLUTION_HEIGHT = 2592  # Camera resolution height in pixels
 CAMERA_FOCAL_LENGTH = 2.75  # Focal Length in mm
 CAMERA_SENSOR_WIDTH = 6.3  # Sensor Width in mm (example value, adjust if needed)
 CAMERA_SENSOR_HEIGHT = 3.53  # Sensor Height in mm (example value, adjust if needed)
-NUM_SEGMENTS = 36 # Number of segments
+NUM_SEGMENTS = 12 # Number of lidar sectors across the camera FOV
+CAMERA_MODEL = 'fov'  # Pinhole focal length from CAMERA_FOV_H ('fov') or from focal length and sensor width ('intrinsics')
+CAMERA_MODEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')  # Column/bearing lookup tables are cached here, None rebuilds them every start
+CAMERA_DEVICE = 0  # Device index, video file, image directory or 'synthetic'
+CAMERA_PACING = 'realtime'  # Recordings at their frame rate, or 'fast' to play every frame as fast as it is processed
+CAMERA_BUFFER_SLOTS = 1  # Frames held between capture and inference, older ones are overwritten
+DISPLAY_WIDTH = 600  # Camera feed size in the GUI, frames are downscaled to this once
+DISPLAY_HEIGHT = 450
+
+FUSION_PERCENTILE = None  # Range of a detected object: closest lidar return in its bearing span, or this percentile (e.g. 10)
 
 # LiDAR Configuration
 LIDAR_PORT = "/dev/tty.usbserial-0001"
 LIDAR_BAUDRATE = 256000
+LIDAR_BACKEND = 'pyrplidar'  # 'pyrplidar' (blocking QThread) or 'async' (asyncio, non-blocking serial)
+LIDAR_QUEUE_SIZE = 2  # Revolutions the async backend buffers before dropping the oldest
+LIDAR_MOUNT_YAW = 0.0  # Lidar bearing (degrees, clockwise) the camera looks along
+LIDAR_RECORD_PATH = None  # Append every revolution to this scan log when set
+LIDAR_REPLAY_PATH = None  # Replay this scan log instead of opening LIDAR_PORT when set
+LIDAR_REPLAY_SPEED = 1.0  # 1.0 real time, >1 accelerated, 0 as fast as possible
+LIDAR_FILTER_DEPTH = 0  # Revolutions kept by the temporal filter, 0 disables it
+LIDAR_FILTER_MODE = 'median'  # 'median' or 'ewma'
+LIDAR_FILTER_BINS = 720  # Angular grid the filter resamples revolutions onto
+LIDAR_FILTER_ALPHA = 0.3  # Weight of the newest revolution in 'ewma' mode
+LIDAR_SYNC_SLOTS = 4  # Revolutions kept for matching frames by timestamp, the async scan pool grows to hold them
+LIDAR_SYNC_INTERPOLATE = False  # Interpolate sector distances between the revolutions either side of a frame
+OBSTACLE_SEGMENTATION = False  # Split every revolution into obstacles and mark them on the lidar plot
+OBSTACLE_MAX_ANGLE_GAP = 3.0  # Degrees without a return that end an obstacle
+OBSTACLE_JUMP_DISTANCE = 15.0  # cm between neighbouring returns that end an obstacle...
+OBSTACLE_JUMP_RATIO = 0.05  # ...plus this fraction of their range
+OBSTACLE_MIN_POINTS = 3  # Smaller clusters are dropped as noise
 
 # YOLO Model Path
 YOLO_MODEL_PATH = '/Users/aaditya/ALSTOM/Lidar/YOLO-Weights/yolov8n.pt'
+YOLO_INPUT_SIZE = 640  # Square model input, frames are letterboxed to this once
+DETECTOR_BACKEND = 'torch'  # 'torch', 'onnx' or 'openvino', compare them with `python detector.py <weights>`
+DETECTOR_CACHE_DIR = None  # Where onnx/openvino exports are cached, None keeps them next to the weights
+DETECTOR_WARMUP_RUNS = 2  # Blank frames run through the model before the first real one
+DETECTOR_CONFIDENCE = 0.5  # Boxes at or below this confidence are dropped inside the model's NMS
+DETECTOR_CLASSES = None  # Class indices to keep (e.g. [0, 2] for person and car), None keeps all
+DETECTOR_MAX_DET = 100  # Most confident boxes kept per frame
+INFERENCE_MAX_BATCH = 4  # Most frames run through the model in one call
+INFERENCE_MAX_WAIT = 0.01  # Seconds to wait for more sources' frames before running a partial batch
+ROI_MODE = False  # Only run YOLO on image columns where the lidar sees something close
+ROI_DISTANCE_THRESHOLD = 300  # cm, sectors with a closer return get a detection band
+ROI_MARGIN = 0.03  # Band padding as a fraction of the image width
+TRACKING_MODE = False  # Run YOLO every N frames and fill the gaps with SORT predictions
+TARGET_FPS = 15  # Output rate N is adapted to hold
+DETECTION_MAX_INTERVAL = 10  # Largest N
+TRACK_MIN_CONFIDENCE = 0.5  # Detect on the next frame when fewer tracks than this were matched
+TRACK_MAX_AGE = 1  # Detector frames a track survives unmatched
+TRACK_MIN_HITS = 1  # Detector frames before a track is shown
+TRACK_FUSED_RANGE = False  # Track lidar range and range rate with each box, and gate matches by range
+TRACK_RANGE_GATE = 100  # cm, a detection this far from a track's predicted range cannot match it
 
 # Class Names for YOLO
 CLASS_NAMES = [
@@ -0,0 +1,137 @@
+import os
+import time
+import shutil
+import argparse
+import numpy as np
+from lidar_stats import LatencyHistogram
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+EXPORT_SUFFIX = {'onnx': '.onnx', 'openvino': '_openvino_model'}
+
+
+class Detector:
+    '''YOLO on a selectable CPU backend: 'torch' runs the .pt weights,
+    'onnx' and 'openvino' run an export of them.
+
+    Exports are made once and cached next to the weights (or in cache_dir),
+    named after the weights and the input size, and rebuilt only when the
+    weights are newer. load() also warms the model up on a blank frame so the
+    first real frame does not pay for lazy initialization. It is slow, so call
+    it from a worker thread; the InferenceService does this before serving.
+
+    Calls take a list of model input sized frames and return one (N, 6) float32
+    array per frame with rows x1, y1, x2, y2, confidence, class in input
+    pixels. Confidence (above conf), class (in classes, None keeps all) and
+    count (the max_det most confident) are filtered inside the model's NMS, so
+    only surviving boxes are copied off the model. Calls are timed into
+    latency.'''
+
+    def __init__(self, model_path, backend='torch', imgsz=640, cache_dir=None, warmup_runs=2,
+                 conf=0.5, classes=None, max_det=100):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown detector backend {backend!r}, expected one of {BACKENDS}")
+        self.model_path = model_path
+        self.backend = backend
+        self.imgsz = imgsz
+        self.cache_dir = cache_dir or os.path.dirname(os.path.abspath(model_path))
+        self.warmup_runs = warmup_runs
+        self.conf = conf
+        self.classes = classes
+        self.max_det = max_det
+        self.model = None
+        self.load_time = None
+        self.warmup_time = None
+        self.latency = LatencyHistogram()
+
+    def export_path(self):
+        stem = os.path.splitext(os.path.basename(self.model_path))[0]
+        return os.path.join(self.cache_dir, f"{stem}_{self.imgsz}{EXPORT_SUFFIX[self.backend]}")
+
+    def export(self):
+        '''Path of the cached export, exporting the weights first if it is missing or stale'''
+        from ultralytics import YOLO
+        path = self.export_path()
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.model_path):
+            return path
+
+        '''Dynamic axes so the InferenceService can run batches of any size'''
+        exported = YOLO(self.model_path).export(format=self.backend, imgsz=self.imgsz, dynamic=True)
+        if os.path.abspath(exported) != os.path.abspath(path):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            shutil.move(exported, path)
+        return path
+
+    def load(self):
+        if self.model is not None:
+            return self
+        from ultralytics import YOLO
+        start = time.perf_counter()
+        if self.backend == 'torch':
+            self.model = YOLO(self.model_path)
+        else:
+            self.model = YOLO(self.export(), task='detect')
+        self.load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        blank = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        for _ in range(self.warmup_runs):
+            self.model(blank, imgsz=self.imgsz, verbose=False)
+        self.warmup_time = time.perf_counter() - start
+        return self
+
+    def __call__(self, frames, verbose=False):
+        start = time.perf_counter()
+        results = self.model(frames, imgsz=self.imgsz, conf=self.conf, classes=self.classes,
+                             max_det=self.max_det, verbose=verbose)
+        detections = [result.boxes.data.cpu().numpy() for result in results]
+        self.latency.record(time.perf_counter() - start)
+        return detections
+
+    def snapshot(self):
+        counts = self.latency.snapshot()
+        return {
+            'backend': self.backend,
+            'load_time': self.load_time,
+            'warmup_time': self.warmup_time,
+            'calls': int(counts.sum()),
+            'latency_p50': self.latency.percentile(50, counts),
+            'latency_p99': self.latency.percentile(99, counts),
+        }
+
+
+def benchmark(model_path, backends, imgsz, runs, batch_size):
+    '''Time every backend on blank frames and print the fastest'''
+    frames = [np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)] * batch_size
+    timings = {}
+    for backend in backends:
+        try:
+            detector = Detector(model_path, backend, imgsz).load()
+        except Exception as error:
+            print(f"{backend:10s} unavailable: {error}")
+            continue
+        start = time.perf_counter()
+        for _ in range(runs):
+            detector(frames)
+        timings[backend] = (time.perf_counter() - start) / runs
+        stats = detector.snapshot()
+        print(f"{backend:10s} load {stats['load_time']:.2f} s  warm-up {stats['warmup_time']:.2f} s  "
+              f"mean {timings[backend] * 1000:.1f} ms  p99 <= {stats['latency_p99'] * 1000:.1f} ms")
+    if timings:
+        print(f"Fastest: {min(timings, key=timings.get)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare YOLO CPU backends on this machine')
+    parser.add_argument("model_path", help="YOLO .pt weights.")
+    parser.add_argument("--backends", nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--batch", help="Frames per call.", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    benchmark(args.model_path, args.backends, args.imgsz, args.runs, args.batch)
@@ -0,0 +1,110 @@
+import os
+import pty
+import tty
+import time
+import select
+import threading
+import numpy as np
+from scan_decoder import PACKET_SIZE
+
+SYNC_BYTE = 0xA5
+SCAN_DESCRIPTOR = bytes([0xA5, 0x5A, 0x05, 0x00, 0x00, 0x40, 0x81])
+CMD_SCAN = 0x20
+CMD_FORCE_SCAN = 0x21
+CMD_STOP = 0x25
+
+
+def make_revolution(samples, rng):
+    '''Raw packets for one synthetic revolution: a room of walls about 4 m away,
+    an obstacle straight ahead and a few dropped (zero distance) samples'''
+    angles = np.arange(samples) * (360.0 / samples)
+    distances = 4000 / np.maximum(np.abs(np.cos(np.radians(angles % 90 - 45))), 0.5)
+    distances[(angles > 350) | (angles < 10)] = 1200
+    distances += rng.normal(0, 10, samples)
+    distances[rng.random(samples) < 0.02] = 0
+
+    angle_q6 = (angles * 64).astype(np.int64)
+    distance_q2 = (np.clip(distances, 0, 16000) * 4).astype(np.int64)
+    quality = np.where(distance_q2 > 0, 47, 0)
+    start = np.zeros(samples, dtype=np.int64)
+    start[0] = 1
+
+    raw = np.zeros((samples, PACKET_SIZE), dtype=np.uint8)
+    raw[:, 0] = (quality << 2) | ((start ^ 1) << 1) | start
+    angle_field = (angle_q6 << 1) | 1
+    raw[:, 1] = angle_field & 0xFF
+    raw[:, 2] = angle_field >> 8
+    raw[:, 3] = distance_q2 & 0xFF
+    raw[:, 4] = distance_q2 >> 8
+    return raw.tobytes()
+
+
+class FakeRPLidar:
+    '''Pseudo-terminal stand-in for an RPLidar.
+
+    Open fake.port like the real serial port. Scan and force-scan commands are
+    answered with the scan descriptor and a stream of synthetic measurement
+    packets, paced at revolutions_per_s. Stop halts the stream. Other commands
+    (motor PWM, reset) are accepted and ignored.'''
+
+    def __init__(self, samples_per_revolution=400, revolutions_per_s=10.0, seed=0):
+        self.samples_per_revolution = samples_per_revolution
+        self.revolutions_per_s = revolutions_per_s
+        self.rng = np.random.default_rng(seed)
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.scanning = False
+        self.stop_flag = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        revolutions = [make_revolution(self.samples_per_revolution, self.rng) for _ in range(8)]
+        stream = b''.join(revolutions)
+        position = 0
+        interval = 0.005
+        chunk = max(1, int(self.samples_per_revolution * self.revolutions_per_s * interval)) * PACKET_SIZE
+        next_write = time.monotonic()
+
+        while not self.stop_flag:
+            timeout = max(0.0, next_write - time.monotonic()) if self.scanning else 0.05
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if readable:
+                try:
+                    self.handle_commands(os.read(self.master, 1024))
+                except OSError:
+                    break
+                continue
+
+            if self.scanning and time.monotonic() >= next_write:
+                data = stream[position:position + chunk]
+                position = (position + chunk) % len(stream)
+                try:
+                    os.write(self.master, data)
+                except OSError:
+                    break
+                next_write += interval
+
+    def handle_commands(self, data):
+        for i in range(len(data) - 1):
+            if data[i] != SYNC_BYTE:
+                continue
+            cmd = data[i + 1]
+            if cmd in (CMD_SCAN, CMD_FORCE_SCAN):
+                os.write(self.master, SCAN_DESCRIPTOR)
+                self.scanning = True
+            elif cmd == CMD_STOP:
+                self.scanning = False
+
+    def close(self):
+        self.stop_flag = True
+        if self.thread.is_alive():
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
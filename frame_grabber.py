@@ -0,0 +1,152 @@
+import time
+import threading
+from collections import deque
+from PySide6 import QtCore
+from frame_pool import FramePool
+from frame_sources import open_source
+
+
+class LatestFrameBuffer:
+    '''Overwrite buffer between capture and inference.
+
+    Capture never waits: when all slots are full the oldest frame is
+    overwritten. get() hands out the newest frame and discards anything older,
+    so inference always works on the freshest image. Every frame that is never
+    handed out counts as dropped and is passed to on_drop, which gives pooled
+    buffers back.
+
+    With block set it is a plain FIFO instead: put() waits for a free slot and
+    get() hands out every frame in order, for playing recordings frame by
+    frame.'''
+
+    def __init__(self, slots=1, on_drop=None, block=False):
+        self.frames = deque(maxlen=slots)
+        self.on_drop = on_drop
+        self.block = block
+        self.condition = threading.Condition()
+        self.captured = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame, timestamp):
+        with self.condition:
+            if self.block:
+                self.condition.wait_for(lambda: len(self.frames) < self.frames.maxlen or self.closed)
+                if self.closed:
+                    self._drop((frame, timestamp))
+                    return
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+                self._drop(self.frames.popleft())
+            self.frames.append((frame, timestamp))
+            self.captured += 1
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        '''Newest (frame, timestamp), or None on timeout or once capture has stopped'''
+        with self.condition:
+            if not self.frames and not self.closed:
+                self.condition.wait(timeout)
+            if not self.frames:
+                return None
+            if self.block:
+                item = self.frames.popleft()
+                self.condition.notify_all()
+                return item
+            frame, timestamp = self.frames.pop()
+            self.dropped += len(self.frames)
+            while self.frames:
+                self._drop(self.frames.popleft())
+            return frame, timestamp
+
+    def _drop(self, item):
+        if self.on_drop is not None:
+            self.on_drop(item[0])
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class FrameGrabber(QtCore.QThread):
+    '''Reads a frame source on its own thread as fast as it delivers, so a
+    camera's internal buffer never fills up behind a slow inference stage and
+    recordings are decoded ahead of the consumer.
+
+    source is a frame source or anything open_source() accepts. Recordings are
+    paced at their frame rate with 'realtime' pacing, dropping frames like a
+    camera would, or handed over one by one as fast as they are consumed with
+    'fast' pacing. Live cameras are always paced by the driver.
+
+    Frames are read into a FramePool sized from the first frame, with room for
+    the buffered frames, the one being read and the one being processed. The
+    consumer releases each frame to pool when it is done with it.'''
+
+    def __init__(self, source=0, slots=1, pacing='realtime'):
+        super().__init__()
+        self.source = source if hasattr(source, 'read') else open_source(source)
+        self.pacing = pacing
+        self.slots = slots
+        self.pool = None
+        block = pacing == 'fast' and not self.source.live
+        self.buffer = LatestFrameBuffer(slots, on_drop=self.release, block=block)
+        self.stop_flag = False
+        self.opened = threading.Event()
+        self.failed = False
+        self.exhausted = False
+
+    def run(self):
+        if not self.source.open():
+            print(f"Couldn't open {self.source}")
+            self.failed = True
+            self.opened.set()
+            self.buffer.close()
+            return
+
+        ret, frame = self.source.read()
+        if ret:
+            self.pool = FramePool(frame.shape, self.slots + 2)
+            self.buffer.put(frame, time.monotonic())
+        else:
+            print(f"Failed to read from {self.source}")
+            self.failed = True
+        self.opened.set()
+
+        paced = self.pacing == 'realtime' and not self.source.live and self.source.fps
+        interval = 1.0 / self.source.fps if paced else 0.0
+        next_frame = time.monotonic() + interval
+        while ret and not self.stop_flag:
+            buffer = self.pool.acquire(timeout=0.1)
+            if buffer is None:
+                continue
+            ret, frame = self.source.read(image=buffer)
+            if not ret:
+                self.pool.release(buffer)
+                if self.source.live:
+                    print(f"Failed to read from {self.source}")
+                    self.failed = True
+                else:
+                    self.exhausted = True
+                break
+            if frame is not buffer:
+                '''The source changed the frame size, the pooled buffer was not used'''
+                self.pool.release(buffer)
+            if interval:
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_frame = max(next_frame, time.monotonic()) + interval
+            self.buffer.put(frame, time.monotonic())
+
+        self.source.release()
+        self.buffer.close()
+
+    def release(self, frame):
+        if self.pool is not None:
+            self.pool.release(frame)
+
+    def stop(self):
+        self.stop_flag = True
+        self.buffer.close()
+        self.wait()
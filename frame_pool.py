@@ -0,0 +1,38 @@
+import threading
+import numpy as np
+
+
+class FramePool:
+    '''Fixed set of equally shaped frame buffers, handed out by acquire() and
+    given back by release() once the last stage is done with them.
+
+    Nothing is allocated after construction. acquire() waits while every buffer
+    is out, so the pool also bounds how many frames are in flight. release()
+    ignores arrays that did not come from the pool, so stages can pass on
+    whatever frame they were given.'''
+
+    def __init__(self, shape, slots, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(slots)]
+        self.index = {id(buffer): i for i, buffer in enumerate(self.buffers)}
+        self.free = list(range(slots))
+        self.condition = threading.Condition()
+        self.waits = 0
+
+    def acquire(self, timeout=None):
+        '''A free buffer, or None on timeout'''
+        with self.condition:
+            if not self.free:
+                self.waits += 1
+                if not self.condition.wait_for(lambda: self.free, timeout):
+                    return None
+            return self.buffers[self.free.pop()]
+
+    def release(self, buffer):
+        i = self.index.get(id(buffer))
+        if i is None:
+            return
+        with self.condition:
+            if i not in self.free:
+                self.free.append(i)
+                self.condition.notify()
@@ -0,0 +1,148 @@
+import os
+import numpy as np
+import cv2 as cv
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class DeviceSource:
+    '''Live camera, paced by the driver'''
+    live = True
+
+    def __init__(self, device=0):
+        self.device = device
+        self.fps = None
+        self.cap = None
+
+    def open(self):
+        self.cap = cv.VideoCapture(self.device)
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        return self.cap.read(image=image)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+    def __str__(self):
+        return f"camera {self.device}"
+
+
+class VideoFileSource:
+    '''Recorded video, decoded by OpenCV at the file's frame rate when paced'''
+    live = False
+
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        self.fps = None
+        self.cap = None
+
+    def open(self):
+        self.cap = cv.VideoCapture(self.path)
+        self.fps = self.cap.get(cv.CAP_PROP_FPS) or None
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        ret, frame = self.cap.read(image=image)
+        if not ret and self.loop:
+            self.cap.set(cv.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(image=image)
+        return ret, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+    def __str__(self):
+        return self.path
+
+
+class ImageDirectorySource:
+    '''Images of a directory in name order, shown at fps when paced'''
+    live = False
+
+    def __init__(self, path, fps=30.0, loop=False):
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+        self.paths = []
+        self.index = 0
+
+    def open(self):
+        self.paths = sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.index = 0
+        return bool(self.paths)
+
+    def read(self, image=None):
+        if self.index >= len(self.paths):
+            if not self.loop:
+                return False, None
+            self.index = 0
+        frame = cv.imread(self.paths[self.index])
+        self.index += 1
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def release(self):
+        self.paths = []
+
+    def __str__(self):
+        return self.path
+
+
+class SyntheticSource:
+    '''Generated frames: a fixed gradient with a few boxes sliding across it,
+    drawn straight into the buffer it is given. frames=0 never ends.'''
+    live = False
+
+    def __init__(self, width=1280, height=720, fps=30.0, frames=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames
+        self.background = None
+        self.index = 0
+
+    def open(self):
+        ramp = np.linspace(40, 200, self.width, dtype=np.uint8)
+        self.background = np.repeat(np.repeat(ramp[None, :, None], self.height, axis=0), 3, axis=2)
+        self.index = 0
+        return True
+
+    def read(self, image=None):
+        if self.frames and self.index >= self.frames:
+            return False, None
+        frame = image if image is not None and image.shape == self.background.shape else np.empty_like(self.background)
+        np.copyto(frame, self.background)
+        box = self.height // 4
+        for i, color in enumerate([(0, 0, 200), (0, 200, 0), (200, 0, 0)]):
+            x = (self.index * (4 + 3 * i) + i * self.width // 3) % (self.width - box)
+            y = (i + 1) * self.height // 5
+            cv.rectangle(frame, (x, y), (x + box, y + box), color, -1)
+        self.index += 1
+        return True, frame
+
+    def release(self):
+        self.background = None
+
+    def __str__(self):
+        return f"synthetic {self.width}x{self.height}"
+
+
+def open_source(spec, loop=False):
+    '''Frame source for a config value: a device index, 'synthetic', an image
+    directory or anything else OpenCV can open as a video'''
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return DeviceSource(int(spec))
+    if spec == 'synthetic':
+        return SyntheticSource()
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, loop=loop)
+    return VideoFileSource(spec, loop=loop)
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class RangeFusion:
+    '''Lidar range of each detected object.
+
+    A detection's column span x1..x2 is turned into a bearing interval through
+    the CameraModel and its range is taken from the lidar returns inside it:
+    the closest one, or the given percentile (e.g. 10) to ignore stray returns.
+
+    Each revolution is sorted by bearing once (O(M log M)). After that all
+    detections of a frame are answered together: both interval ends are found
+    with searchsorted (O(N log M)) and the reduction runs over the slices in
+    one NumPy call. Objects without a return in their interval get NaN.'''
+
+    def __init__(self, layout, camera, percentile=None):
+        self.layout = layout
+        self.camera = camera
+        self.percentile = percentile
+        self.scan = None
+        self.bearings = np.empty(0)
+        self.distances = np.full(1, np.inf)
+
+    def prepare(self, scan):
+        '''Sort the returns of a new revolution that fall inside the FOV by bearing'''
+        if scan is self.scan:
+            return
+        self.scan = scan
+        relative = self.layout.relative_bearing(scan.angle)
+        keep = (scan.distance > 0) & (np.abs(relative) <= self.camera.fov / 2)
+        relative = relative[keep]
+        order = np.argsort(relative, kind='stable')
+        self.bearings = relative[order]
+        '''One inf past the end keeps every slice start a valid index for reduceat'''
+        self.distances = np.append(scan.distance[keep][order], np.inf)
+
+    def bearing(self, columns, image_width=None):
+        '''Bearing relative to the camera axis of columns of an image_width wide frame'''
+        columns = np.asarray(columns, dtype=float)
+        if image_width and image_width != self.camera.image_width:
+            columns = columns * (self.camera.image_width / image_width)
+        return self.camera.bearing(columns)
+
+    def ranges(self, x1, x2, image_width=None):
+        '''Range in cm for every column span x1[i]..x2[i], NaN when no return falls inside'''
+        if len(x1) == 0 or len(self.bearings) == 0:
+            return np.full(len(x1), np.nan)
+        lo = np.searchsorted(self.bearings, self.bearing(x1, image_width), side='left')
+        hi = np.searchsorted(self.bearings, self.bearing(x2, image_width), side='right')
+        empty = hi <= lo
+
+        if self.percentile is None:
+            ranges = np.minimum.reduceat(self.distances, np.column_stack((lo, hi)).ravel())[::2]
+        else:
+            ranges = self._percentile(lo, hi)
+        ranges[empty] = np.nan
+        return ranges
+
+    def _percentile(self, lo, hi):
+        '''Percentile of every slice at once: the slices are gathered into one
+        inf padded matrix, sorted per row and indexed at each row's rank'''
+        counts = np.maximum(hi - lo, 1)
+        index = lo[:, None] + np.arange(counts.max())
+        values = np.where(index < hi[:, None], self.distances[np.minimum(index, len(self.distances) - 1)], np.inf)
+        values.sort(axis=1)
+        rank = np.floor((counts - 1) * self.percentile / 100.0).astype(np.intp)
+        return values[np.arange(len(lo)), rank]
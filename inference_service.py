@@ -0,0 +1,96 @@
+import time
+import queue
+from concurrent.futures import Future
+from PySide6 import QtCore
+
+
+class InferenceService(QtCore.QThread):
+    '''Runs one model for any number of frame sources.
+
+    Sources submit frames and get a Future back. The service takes the first
+    pending frame, then keeps collecting until it has max_batch_size frames,
+    one frame per registered source, or max_wait seconds have passed. Frames
+    already queued (several crops of one frame, say) always join the batch up
+    to max_batch_size. It then runs the model once on the whole batch and
+    resolves each Future with the result for its frame.
+
+    The model is a Detector, loaded and warmed up on this thread before the
+    first batch so the GUI thread never waits for it. If loading fails every
+    Future fails with the error.'''
+
+    def __init__(self, model, max_batch_size=4, max_wait=0.01):
+        super().__init__()
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.sources = 0
+        self.stop_flag = False
+        self.batches = 0
+        self.frames = 0
+        self.error = None
+
+    def register_source(self):
+        '''Each source calls this once, the batch target follows the number of sources'''
+        self.sources += 1
+        return self.sources - 1
+
+    def submit(self, frame):
+        future = Future()
+        self.requests.put((frame, future))
+        return future
+
+    def run(self):
+        try:
+            self.model.load()
+        except Exception as error:
+            print(f"Couldn't load detector: {error}")
+            self.error = error
+
+        while not self.stop_flag:
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            target = max(1, min(self.max_batch_size, self.sources))
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            self.infer(batch)
+
+        '''Fail whatever is still queued so no source waits forever'''
+        while not self.requests.empty():
+            _, future = self.requests.get_nowait()
+            future.cancel()
+
+    def infer(self, batch):
+        frames = [frame for frame, _ in batch]
+        try:
+            if self.error is not None:
+                raise self.error
+            results = self.model(frames, verbose=False)
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        self.batches += 1
+        self.frames += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stop(self):
+        self.stop_flag = True
+        self.wait()
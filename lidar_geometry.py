@@ -0,0 +1,19 @@
+import numpy as np
+from scan_decoder import ANGLE_Q6_SCALE
+
+# sin/cos of every 15 bit angle_q6 the device can report. Indexing by the raw
+# fixed point angle replaces per sample radians/sin/cos with a table lookup,
+# and values past 360 degrees wrap naturally.
+Q6_TABLE_SIZE = 1 << 15
+SIN_Q6 = np.sin(np.radians(np.arange(Q6_TABLE_SIZE) / ANGLE_Q6_SCALE))
+COS_Q6 = np.cos(np.radians(np.arange(Q6_TABLE_SIZE) / ANGLE_Q6_SCALE))
+
+
+def polar_to_cartesian(angle_q6, distances, x_out, y_out):
+    '''Convert a whole revolution to x/y, writing into the caller's arrays.
+    x points right and y forward, matching x = d * sin(angle), y = d * cos(angle)'''
+    np.take(SIN_Q6, angle_q6, out=x_out)
+    np.take(COS_Q6, angle_q6, out=y_out)
+    np.multiply(x_out, distances, out=x_out)
+    np.multiply(y_out, distances, out=y_out)
+    return x_out, y_out
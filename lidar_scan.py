@@ -0,0 +1,49 @@
+import numpy as np
+
+# One lidar sample, a revolution is a contiguous run of these records
+SCAN_DTYPE = np.dtype([
+    ('x', 'f8'),
+    ('y', 'f8'),
+    ('distance', 'f8'),  # cm
+    ('angle', 'f8'),  # degrees clockwise from the lidar zero
+    ('quality', 'u1'),
+    ('timestamp', 'f8'),  # time.monotonic() when the sample was read
+])
+
+
+class LidarScan:
+    '''Read-only view of one revolution in a ScanPool slot.
+
+    The scan is created once by the lidar source and the same object is passed
+    by reference through every signal hop. The fields are views into the pool
+    record, nothing is copied. The slot is reused after the pool wraps around,
+    so consumers should be done with a scan within pool.slots - 1 revolutions.'''
+
+    __slots__ = ('records', 'timestamp', 'slot', 'x', 'y', 'distance', 'angle', 'quality', 'sample_time')
+
+    def __init__(self, records, timestamp, slot):
+        records.flags.writeable = False
+        self.records = records
+        self.timestamp = timestamp
+        self.slot = slot
+        self.x = records['x']
+        self.y = records['y']
+        self.distance = records['distance']
+        self.angle = records['angle']
+        self.quality = records['quality']
+        self.sample_time = records['timestamp']
+
+    def __len__(self):
+        return len(self.records)
+
+
+class ScanPool:
+    '''Fixed set of preallocated revolution buffers handed out round robin'''
+
+    def __init__(self, slots=8, capacity=2048):
+        self.slots = slots
+        self.capacity = capacity
+        self.records = np.zeros((slots, capacity), dtype=SCAN_DTYPE)
+
+    def scan(self, slot, length, timestamp):
+        return LidarScan(self.records[slot, :length], timestamp, slot)
@@ -0,0 +1,105 @@
+import time
+from bisect import bisect_right
+import numpy as np
+
+
+class LatencyHistogram:
+    '''Log2 bucketed histogram of durations in seconds, from min_value up to
+    min_value * 2 ** (buckets - 1), with an overflow bucket on top.
+
+    Only one thread records into a histogram. Recording is a single counter
+    increment with no lock, and other threads read through snapshot(), which
+    copies the counters.'''
+
+    def __init__(self, min_value=1e-6, buckets=27):
+        self.edges = [min_value * 2.0 ** i for i in range(buckets)]
+        self.counts = np.zeros(buckets + 1, dtype=np.int64)
+
+    def record(self, value):
+        self.counts[bisect_right(self.edges, value)] += 1
+
+    def snapshot(self):
+        return self.counts.copy()
+
+    def percentile(self, q, counts=None):
+        '''Upper edge of the bucket holding the q-th percentile, None when empty'''
+        if counts is None:
+            counts = self.snapshot()
+        total = counts.sum()
+        if total == 0:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(counts), total * q / 100.0))
+        return self.edges[min(bucket, len(self.edges) - 1)]
+
+
+class AcquisitionStats:
+    '''Counters for one lidar source, written by the acquisition thread and
+    read from anywhere through snapshot().'''
+
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.samples = 0
+        self.zero_samples = 0
+        self.revolutions = 0
+        self.desyncs = 0
+        self.overflows = 0
+        self.dropped = 0
+
+        self.decode_time = LatencyHistogram()
+        self.revolution_period = LatencyHistogram()
+        self.emit_latency = LatencyHistogram()
+
+        '''Running mean and variance of the revolution period (Welford)'''
+        self.last_revolution = None
+        self.period_mean = 0.0
+        self.period_m2 = 0.0
+        self.periods = 0
+
+        self._last_snapshot = (self.start_time, 0, 0)
+
+    def record_batch(self, samples, zero_samples, decode_time):
+        self.samples += samples
+        self.zero_samples += zero_samples
+        self.decode_time.record(decode_time)
+
+    def record_revolution(self, timestamp):
+        self.revolutions += 1
+        if self.last_revolution is not None:
+            period = timestamp - self.last_revolution
+            self.revolution_period.record(period)
+            self.periods += 1
+            delta = period - self.period_mean
+            self.period_mean += delta / self.periods
+            self.period_m2 += delta * (period - self.period_mean)
+        self.last_revolution = timestamp
+
+    def record_emit_latency(self, latency):
+        '''Called on the receiving side with now - scan.timestamp'''
+        self.emit_latency.record(latency)
+
+    def snapshot(self):
+        '''Rates since the previous snapshot plus totals and latency percentiles'''
+        now = time.monotonic()
+        samples, revolutions = self.samples, self.revolutions
+        last_time, last_samples, last_revolutions = self._last_snapshot
+        self._last_snapshot = (now, samples, revolutions)
+        elapsed = max(now - last_time, 1e-9)
+
+        decode = self.decode_time.snapshot()
+        emit = self.emit_latency.snapshot()
+        return {
+            'samples_per_s': (samples - last_samples) / elapsed,
+            'revolutions_per_s': (revolutions - last_revolutions) / elapsed,
+            'period_mean': self.period_mean,
+            'period_jitter': (self.period_m2 / self.periods) ** 0.5 if self.periods else 0.0,
+            'zero_ratio': self.zero_samples / samples if samples else 0.0,
+            'decode_p50': self.decode_time.percentile(50, decode),
+            'decode_p99': self.decode_time.percentile(99, decode),
+            'emit_p50': self.emit_latency.percentile(50, emit),
+            'emit_p99': self.emit_latency.percentile(99, emit),
+            'samples': samples,
+            'revolutions': revolutions,
+            'desyncs': self.desyncs,
+            'overflows': self.overflows,
+            'dropped': self.dropped,
+        }
@@ -1,52 +1,66 @@
 from PySide6 import QtCore
 import numpy as np
-from math import cos, sin, radians
+import time
 from pyrplidar import PyRPlidar
+from scan_decoder import ScanDecoder
+from revolution_buffer import RevolutionBuffer
+from scan_log import ScanLogWriter
+from lidar_stats import AcquisitionStats
 
 class LidarThread(QtCore.QThread):
-    new_data = QtCore.Signal(np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+    new_data = QtCore.Signal(object)
 
-    def __init__(self, port, baudrate):
+    def __init__(self, port, baudrate, batch_size=128, record_path=None):
         super().__init__()
         self.lidar = PyRPlidar()
         self.port = port
         self.baudrate = baudrate
         self.stop_flag = False
+        self.decoder = ScanDecoder(batch_size)
+        self.revolutions = RevolutionBuffer()
+        self.record_path = record_path
+        self.recorder = None
+        self.stats = AcquisitionStats()
 
     def run(self):
         self.lidar.connect(port=self.port, baudrate=self.baudrate, timeout=3)
         self.lidar.set_motor_pwm(660)
-        scan_generator = self.lidar.force_scan()
+
+        '''force_scan sends the scan command and consumes the response descriptor,
+        after that the raw measurement packets are read straight off the serial port'''
+        self.lidar.force_scan()
+        serial = self.lidar.lidar_serial
+        if self.record_path:
+            self.recorder = ScanLogWriter(self.record_path, self.revolutions.capacity)
 
         while not self.stop_flag:
-            x_coords, y_coords, angles, distances = [], [], [], []
-
-            for count, scan in enumerate(scan_generator()):
-                angle, distance = self.parse_scan(scan)
-                if distance > 0:
-                    x = distance * sin(radians(angle))
-                    y = distance * cos(radians(angle))
-                    x_coords.append(x)
-                    y_coords.append(y)
-                    angles.append(angle)
-                    distances.append(distance)
-
-                if count >= 360:
-                    self.new_data.emit(np.array(x_coords), np.array(y_coords), 
-                                       np.array(distances), np.array(angles))
-                    break
+            n = self.decoder.read(serial)
+            if n == 0:
+                continue
+            self.stats.record_batch(n, n - int(np.count_nonzero(self.decoder.distance_q2[:n])), self.decoder.decode_time)
+            self.stats.desyncs = self.decoder.desync_count
+            self.stats.overflows = self.revolutions.overflow_count
 
-        self.cleanup()
+            for slot in self.revolutions.push(self.decoder, time.monotonic()):
+                self.stats.record_revolution(self.revolutions.timestamps[slot])
+                if self.recorder is not None:
+                    self.recorder.write(time.time(), *self.revolutions.raw(slot))
+                self.new_data.emit(self.revolutions.scan(slot))
 
-    def parse_scan(self, scan):
-        line = str(scan).replace('{', ' ').replace('}', ' ').split(',')
-        return float(line[2].split(':')[1]), float(line[3].split(':')[1]) / 10
+        self.cleanup()
 
     def cleanup(self):
         self.lidar.stop()
         self.lidar.set_motor_pwm(0)
         self.lidar.disconnect()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def consumed(self):
+        '''Every revolution is emitted as it completes, there is nothing to hand back'''
+        pass
 
     def stop(self):
         self.stop_flag = True
-        self.wait()
\ No newline at end of file
+        self.wait()
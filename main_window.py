@@ -1,12 +1,15 @@
-from PySide6 import QtWidgets, QtGui
+from PySide6 import QtWidgets, QtGui, QtCore
 import pyqtgraph as pg
 import numpy as np
 from camera_thread import CameraThread
+from config import DISPLAY_WIDTH, DISPLAY_HEIGHT
 import cv2 as cv
 
 class MainWindow(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
+        self.camera_thread = CameraThread()
+        self.sector_layout = self.camera_thread.sector_layout
         self.setup_ui()
         self.setup_threads()
 
@@ -22,7 +25,8 @@ class MainWindow(QtWidgets.QWidget):
         layout.addWidget(self.lidar_plot_widget, 0, 0)
         layout.addWidget(self.camera_label, 0, 1)
         layout.addWidget(self.histogram_plot_widget, 1, 0)
-        layout.addWidget(QtWidgets.QLabel(''), 1, 1)
+        self.stats_label = self.setup_stats_label()
+        layout.addWidget(self.stats_label, 1, 1)
         self.setLayout(layout)
 
     def setup_lidar_plot(self):
@@ -37,15 +41,19 @@ class MainWindow(QtWidgets.QWidget):
         '''Create a scatter plot for LiDAR data'''
         self.lidar_plot_data = plot.plot([], [], pen=None, symbolBrush=(255, 0, 0), symbolSize=3, symbolPen=None)
 
+        '''Nearest point of every obstacle, when obstacle segmentation is on'''
+        self.obstacle_plot_data = plot.plot([], [], pen=None, symbol='o', symbolBrush=None, symbolSize=12,
+                                            symbolPen=pg.mkPen(color=(255, 200, 0), width=2))
+
         '''Create lines for each angle'''
         self.lines = []
-        for _ in range(36):
+        for _ in range(self.sector_layout.num_sectors):
             self.lines.append(plot.plot([], [], pen=pg.mkPen(color=(0, 255, 0), width=2)))
         # self.lines = [plot.plot([], [], pen=pg.mkPen(color=(0, 255, 0), width=2)) for _ in range(36)
 
         '''Create text items for each angle'''
         self.text_items = []
-        for _ in range(36):
+        for _ in range(self.sector_layout.num_sectors):
             self.text_items.append(pg.TextItem('', anchor=(0.5, 1)))
         # self.text_items = [pg.TextItem('', anchor=(0.5, 1)) for _ in range(36)]
         for item in self.text_items:
@@ -58,7 +66,7 @@ class MainWindow(QtWidgets.QWidget):
 
     def setup_camera_label(self):
         label = QtWidgets.QLabel()
-        label.setFixedSize(600, 450)
+        label.setFixedSize(DISPLAY_WIDTH, DISPLAY_HEIGHT)
         label.setScaledContents(True)
 
         return label
@@ -79,22 +87,39 @@ class MainWindow(QtWidgets.QWidget):
 
         return plot_widget
 
+    def setup_stats_label(self):
+        '''Lidar acquisition counters, refreshed once a second'''
+        label = QtWidgets.QLabel('')
+        label.setFixedSize(600, 450)
+        label.setAlignment(QtCore.Qt.AlignTop | QtCore.Qt.AlignLeft)
+        label.setStyleSheet('font-family: monospace')
+
+        self.stats_timer = QtCore.QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats_label)
+        self.stats_timer.start(1000)
+
+        return label
+
     def setup_threads(self):
-        self.camera_thread = CameraThread()
         self.camera_thread.new_frame.connect(self.update_camera_feed)
         self.camera_thread.new_lidar_data.connect(self.update_lidar_plot)
         self.camera_thread.new_lidar_data.connect(self.update_histogram_plot)
+        self.camera_thread.new_sector_stats.connect(self.update_sector_lines)
+        self.camera_thread.new_obstacles.connect(self.update_obstacles)
         self.camera_thread.start()
 
     def update_camera_feed(self, frame):
+        '''The QImage wraps the BGR buffer without a copy, fromImage makes the only one'''
         height, width, channel = frame.shape
         bytes_per_line = 3 * width
-        qt_image = QtGui.QImage(frame.data, width, height, bytes_per_line, QtGui.QImage.Format_RGB888).rgbSwapped()
+        qt_image = QtGui.QImage(frame.data, width, height, bytes_per_line, QtGui.QImage.Format_BGR888)
         self.camera_label.setPixmap(QtGui.QPixmap.fromImage(qt_image))
+        self.camera_thread.display_scaler.pool.release(frame)
 
     def add_fov_lines(self, plot):
         fov_lines = []
-        for angle in [51, 309, 0]:
+        layout = self.sector_layout
+        for angle in [layout.edges[0], layout.edges[-1], layout.mount_yaw]:
             x = 500 * np.sin(np.radians(angle))
             y = 500 * np.cos(np.radians(angle))
             line = pg.PlotDataItem([0, x], [0, y], pen=pg.mkPen(color=(0, 0, 255), width=2))
@@ -139,52 +164,58 @@ class MainWindow(QtWidgets.QWidget):
     #             line.setData([], [])
     #             self.text_items[i].setText('')
 
-    def update_lidar_plot(self, x, y, distances, angles):
+    def update_lidar_plot(self, scan):
         '''Plot the graph of LiDAR data'''
-        self.lidar_plot_data.setData(x, y)
-        
-        target_angles = [310, 320, 330, 340, 350, 360, 0, 10, 20, 30, 40, 50]
-        distance_values = np.zeros(12)  # Array to store distances at specified angles
-        
-        '''Here we are trying to first get all the angles in +- 5 range of the specified angles
-        and then we are trying to get the closest object to the LiDAR sensor at that angle'''
-        for i, angle_target in enumerate(target_angles):
-            valid_x, valid_y, valid_distances = [], [], []
-            for j, angle in enumerate(angles):
-                if angle_target - 5 <= angle < angle_target + 5 or (angle_target == 360 and 355 <= angle < 360) or (angle_target == 0 and 0 <= angle < 5):
-                    valid_x.append(x[j])
-                    valid_y.append(y[j])
-                    valid_distances.append(distances[j])
-            
-            if valid_distances:
-                min_distance_index = valid_distances.index(min(valid_distances))  # Get the index of the closest object
-                closest_x = valid_x[min_distance_index]
-                closest_y = valid_y[min_distance_index]
-                closest_distance = valid_distances[min_distance_index]
-                
-                line = self.lines[i]
+        self.lidar_plot_data.setData(scan.x, scan.y)
+
+    def update_obstacles(self, obstacles):
+        self.obstacle_plot_data.setData(obstacles.nearest_x, obstacles.nearest_y)
+
+    def update_sector_lines(self, stats):
+        '''Draw a line to the closest object in each sector, the reduction itself is
+        done once per revolution by CameraThread and shared with the camera overlay'''
+        for i, line in enumerate(self.lines):
+            if i < len(stats.count) and stats.count[i]:
+                closest_x, closest_y = stats.min_x[i], stats.min_y[i]
                 line.setData([0, closest_x], [0, closest_y])
-                self.text_items[i].setText(f'{closest_distance:.2f} cm')
+                self.text_items[i].setText(f'{stats.min_distance[i]:.2f} cm')
                 self.text_items[i].setPos(closest_x / 2, closest_y / 2)
-                
-                distance_values[i] = closest_distance  # Store the closest distance in the array
             else:
-                line = self.lines[i]
                 line.setData([], [])
                 self.text_items[i].setText('')
-                distance_values[i] = None  # No valid distance found
-        
-        # print("Distance values at specified angles:", distance_values)
-        return distance_values  # Optionally return the array
-
-
-    def update_histogram_plot(self, x, y, distances, angles):
-        # Adjust angles to be in the range of -180 to 180 degrees
-        '''If angles is greater than 309, subtract 360 from the angle, otherwise keep the angle as is'''
-        transformed_angles = np.where(angles > 309, angles - 360, angles)
 
-        '''Filter out angles that are not within the range of 51 to 309 degrees'''
-        filtered_mask = (angles > 309) | (angles < 51)
+    def update_stats_label(self):
+        stats = self.camera_thread.lidar_thread.stats.snapshot()
+        detector = self.camera_thread.inference.model.snapshot()
+        skew = self.camera_thread.scan_sync.skew
+        skew_counts = skew.snapshot()
+
+        def ms(value):
+            return '-' if value is None else f'{value * 1000:.2f} ms'
+
+        self.stats_label.setText(
+            f"LiDAR acquisition\n"
+            f"  samples/s        {stats['samples_per_s']:.0f}\n"
+            f"  revolutions/s    {stats['revolutions_per_s']:.1f}\n"
+            f"  period           {stats['period_mean'] * 1000:.1f} ms +- {stats['period_jitter'] * 1000:.2f} ms\n"
+            f"  zero distance    {stats['zero_ratio'] * 100:.1f} %\n"
+            f"  decode p50/p99   {ms(stats['decode_p50'])} / {ms(stats['decode_p99'])}\n"
+            f"  emit p50/p99     {ms(stats['emit_p50'])} / {ms(stats['emit_p99'])}\n"
+            f"  desyncs          {stats['desyncs']}\n"
+            f"  overflows        {stats['overflows']}\n"
+            f"  dropped          {stats['dropped']}\n"
+            f"Detector ({detector['backend']})\n"
+            f"  p50/p99          {ms(detector['latency_p50'])} / {ms(detector['latency_p99'])}\n"
+            f"Frame/scan skew p50/p99  {ms(skew.percentile(50, skew_counts))} / {ms(skew.percentile(99, skew_counts))}"
+        )
+
+    def update_histogram_plot(self, scan):
+        angles, distances = scan.angle, scan.distance
+        # Adjust angles to be in the range of -180 to 180 degrees around the camera axis
+        transformed_angles = self.sector_layout.relative_bearing(angles)
+
+        '''Filter out angles that are outside the camera field of view'''
+        filtered_mask = np.abs(transformed_angles) <= self.sector_layout.fov / 2
 
         '''Get the filtered angles and distances'''
         filtered_angles = transformed_angles[filtered_mask]
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+class Obstacles:
+    '''Clusters of one revolution, one entry per obstacle. Angles are lidar
+    bearings in degrees, distances and coordinates in cm. An obstacle spans
+    clockwise from start_angle to end_angle, which is smaller when it crosses
+    0 degrees; width is the straight distance between its end points.'''
+
+    def __init__(self, n):
+        self.count = np.zeros(n, dtype=np.intp)
+        self.centroid_x = np.zeros(n)
+        self.centroid_y = np.zeros(n)
+        self.nearest_distance = np.zeros(n)
+        self.nearest_angle = np.zeros(n)
+        self.nearest_x = np.zeros(n)
+        self.nearest_y = np.zeros(n)
+        self.start_angle = np.zeros(n)
+        self.end_angle = np.zeros(n)
+        self.width = np.zeros(n)
+
+    def __len__(self):
+        return len(self.count)
+
+
+class ObstacleSegmenter:
+    '''Splits a revolution into obstacles along the scan order.
+
+    Consecutive returns belong to the same obstacle unless the bearing between
+    them jumps by more than max_angle_gap degrees, or the straight distance
+    between them exceeds jump_distance + jump_ratio * range (cm), which lets
+    far objects, whose returns are naturally further apart, stay in one piece.
+    The obstacle running through 0 degrees is kept whole. Obstacles with fewer
+    than min_points returns are discarded as noise.
+
+    Revolutions come from the device in bearing order, so this is one linear
+    vectorized pass; only a revolution that is not in order gets sorted first.'''
+
+    def __init__(self, max_angle_gap=3.0, jump_distance=15.0, jump_ratio=0.05, min_points=3):
+        self.max_angle_gap = max_angle_gap
+        self.jump_distance = jump_distance
+        self.jump_ratio = jump_ratio
+        self.min_points = min_points
+
+    def segment(self, scan):
+        valid = scan.distance > 0
+        angle, distance = scan.angle[valid], scan.distance[valid]
+        x, y = scan.x[valid], scan.y[valid]
+        n = len(angle)
+        if n < self.min_points:
+            return Obstacles(0)
+        if np.any(angle[1:] < angle[:-1]):
+            order = np.argsort(angle, kind='stable')
+            angle, distance, x, y = angle[order], distance[order], x[order], y[order]
+
+        '''Break flags between each point and the next one, the last one wraps to the first'''
+        angle_gap = np.empty(n)
+        np.subtract(angle[1:], angle[:-1], out=angle_gap[:-1])
+        angle_gap[-1] = angle[0] + 360 - angle[-1]
+        gap = np.hypot(np.roll(x, -1) - x, np.roll(y, -1) - y)
+        limit = self.jump_distance + self.jump_ratio * np.minimum(distance, np.roll(distance, -1))
+        breaks = (angle_gap > self.max_angle_gap) | (gap > limit)
+
+        if not breaks.any():
+            starts = np.zeros(1, dtype=np.intp)
+        else:
+            '''Start at the first obstacle after a break so the one crossing 0 degrees stays whole'''
+            shift = int(np.argmax(breaks)) + 1
+            if shift < n:
+                angle, distance, x, y, breaks = (np.roll(a, -shift) for a in (angle, distance, x, y, breaks))
+            starts = np.concatenate(([0], np.flatnonzero(breaks[:-1]) + 1))
+
+        '''Sums and minima over the contiguous partition, noise segments are dropped afterwards'''
+        count = np.diff(np.append(starts, n))
+        sum_x = np.add.reduceat(x, starts)
+        sum_y = np.add.reduceat(y, starts)
+        nearest = np.minimum.reduceat(distance, starts)
+
+        '''First point of each segment at its minimum: candidates are in position order and
+        segment labels rise with position, so the first of each label is where it changes'''
+        flags = np.zeros(n, dtype=np.intp)
+        flags[starts] = 1
+        labels = np.cumsum(flags) - 1
+        candidates = np.flatnonzero(distance == nearest[labels])
+        first = candidates[np.r_[True, labels[candidates][1:] != labels[candidates][:-1]]]
+
+        keep = count >= self.min_points
+        starts, count, first = starts[keep], count[keep], first[keep]
+        ends = starts + count - 1
+        obstacles = Obstacles(len(starts))
+        obstacles.count[:] = count
+        obstacles.centroid_x[:] = sum_x[keep] / count
+        obstacles.centroid_y[:] = sum_y[keep] / count
+        obstacles.nearest_distance[:] = nearest[keep]
+        obstacles.nearest_angle[:] = angle[first]
+        obstacles.nearest_x[:] = x[first]
+        obstacles.nearest_y[:] = y[first]
+        obstacles.start_angle[:] = angle[starts]
+        obstacles.end_angle[:] = angle[ends]
+        obstacles.width[:] = np.hypot(x[ends] - x[starts], y[ends] - y[starts])
+        return obstacles
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class OverlayRenderer:
+    '''Composites the overlays that do not change every frame.
+
+    Each layer is a BGRA image the size of the display frame, redrawn only when
+    its content changes, with alpha 0 wherever nothing was drawn. The layers are
+    flattened into one cached BGR image and mask, which is copied onto every
+    frame in a single np.copyto. Layers are stacked in the order they were
+    first requested.
+
+    The mask is kept per channel: a (height, width, 1) mask broadcast by
+    np.copyto is an order of magnitude slower than a full one.'''
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.layers = {}
+        self.image = np.zeros((height, width, 3), dtype=np.uint8)
+        self.mask = np.zeros((height, width, 3), dtype=bool)
+        self.dirty = False
+
+    def layer(self, name):
+        '''Cleared layer to draw on, with colors given as (b, g, r, 255)'''
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        else:
+            layer.fill(0)
+        self.dirty = True
+        return layer
+
+    def blend(self, frame):
+        if self.dirty:
+            self._composite()
+        np.copyto(frame, self.image, where=self.mask)
+
+    def _composite(self):
+        self.image.fill(0)
+        self.mask.fill(False)
+        for layer in self.layers.values():
+            drawn = np.repeat(layer[..., 3:] > 0, 3, axis=2)
+            np.copyto(self.image, layer[..., :3], where=drawn)
+            self.mask |= drawn
+        self.dirty = False
@@ -0,0 +1,77 @@
+import numpy as np
+import cv2 as cv
+from frame_pool import FramePool
+
+
+class Letterbox:
+    '''Resizes full resolution frames once to the square model input, keeping
+    the aspect ratio and padding the rest, into a buffer reused every frame.
+    scale and offset map detections back to full resolution.'''
+
+    def __init__(self, size=640, pad_value=114):
+        self.size = size
+        self.pad_value = pad_value
+        self.buffer = np.full((size, size, 3), pad_value, dtype=np.uint8)
+        self.resized = None
+        self.band = None
+        self.source_shape = None
+        self.scale = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+
+    def _configure(self, shape):
+        height, width = shape[:2]
+        self.source_shape = shape
+        self.scale = min(self.size / width, self.size / height)
+        new_width = int(round(width * self.scale))
+        new_height = int(round(height * self.scale))
+        self.offset_x = (self.size - new_width) // 2
+        self.offset_y = (self.size - new_height) // 2
+        self.buffer.fill(self.pad_value)
+
+        '''Full width bands (landscape frames) are contiguous, resize straight into them'''
+        band = self.buffer[self.offset_y:self.offset_y + new_height, self.offset_x:self.offset_x + new_width]
+        self.resized = band if band.flags.c_contiguous else np.empty(band.shape, dtype=np.uint8)
+        self.band = band
+
+    def __call__(self, frame):
+        if frame.shape != self.source_shape:
+            self._configure(frame.shape)
+        height, width = self.resized.shape[:2]
+        cv.resize(frame, (width, height), dst=self.resized, interpolation=cv.INTER_AREA)
+        if self.resized is not self.band:
+            self.band[:] = self.resized
+        return self.buffer
+
+    def map_boxes(self, boxes):
+        '''Map the first four (x1, y1, x2, y2) columns of an (N, >=4) array in place'''
+        boxes[:, [0, 2]] -= self.offset_x
+        boxes[:, [1, 3]] -= self.offset_y
+        boxes[:, :4] /= self.scale
+        return boxes
+
+
+class DisplayScaler:
+    '''Cheap downscale of full resolution frames for the GUI, into a FramePool
+    of display sized buffers. The GUI releases each buffer to pool once it has
+    painted it, so a buffer is never overwritten while on screen.'''
+
+    def __init__(self, width, height, slots=3):
+        self.width = width
+        self.height = height
+        self.pool = FramePool((height, width, 3), slots)
+        self.scale_x = 1.0
+        self.scale_y = 1.0
+
+    def __call__(self, frame, timeout=None):
+        '''Display sized copy, or None when the GUI still holds every buffer after timeout'''
+        buffer = self.pool.acquire(timeout)
+        if buffer is None:
+            return None
+        self.scale_x = self.width / frame.shape[1]
+        self.scale_y = self.height / frame.shape[0]
+        cv.resize(frame, (self.width, self.height), dst=buffer, interpolation=cv.INTER_AREA)
+        return buffer
+
+    def to_display(self, x1, y1, x2, y2):
+        return (int(x1 * self.scale_x), int(y1 * self.scale_y), int(x2 * self.scale_x), int(y2 * self.scale_y))
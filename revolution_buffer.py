@@ -0,0 +1,180 @@
+import numpy as np
+from scan_decoder import ANGLE_Q6_SCALE, DISTANCE_Q2_SCALE
+from lidar_geometry import polar_to_cartesian
+from lidar_scan import ScanPool
+
+HALF_TURN_Q6 = 180 * 64
+
+
+class RevolutionBuffer:
+    '''Fixed capacity ring of revolution slots fed from a ScanDecoder.
+
+    Samples are framed into revolutions on the device start-of-scan flag, or on
+    the angle wrapping back past 0 for as long as no start flag has been seen.
+    Every revolution is written contiguously into its own ScanPool slot, so a
+    finished sweep is handed out as a LidarScan view of the slot records. A
+    slot is reused once the ring comes back around to it, consumers have
+    slots - 1 revolutions to finish with a sweep.
+
+    Every slot also keeps the revolution's raw samples, zero distance dropouts
+    included, for recording.
+
+    A batch only has the time it was read at, so its samples are spread evenly
+    between the previous batch's read time and this one, and a revolution is
+    stamped with the time of the sample that starts the next one.'''
+
+    def __init__(self, capacity=2048, slots=8, min_samples=16):
+        self.capacity = capacity
+        self.slots = slots
+        self.min_samples = min_samples
+
+        self.angle_q6 = np.zeros((slots, capacity), dtype=np.uint16)
+        self.distance_q2 = np.zeros((slots, capacity), dtype=np.uint16)
+        self.pool = ScanPool(slots, capacity)
+        self.lengths = np.zeros(slots, dtype=np.intp)
+        self.timestamps = np.zeros(slots)
+
+        self.raw_angle_q6 = np.zeros((slots, capacity), dtype=np.uint16)
+        self.raw_distance_q2 = np.zeros((slots, capacity), dtype=np.uint16)
+        self.raw_quality = np.zeros((slots, capacity), dtype=np.uint8)
+        self.raw_lengths = np.zeros(slots, dtype=np.intp)
+        self.raw_length = 0
+
+        self.slot = 0
+        self.length = 0
+        self.overflow_count = 0
+        self.last_angle_q6 = 0
+        self.last_timestamp = None
+        self.use_start_flag = False
+
+        '''Per batch scratch, grown on first use to the decoder batch size'''
+        self._keep = np.zeros(0, dtype=bool)
+        self._delta = np.zeros(0, dtype=np.int32)
+        self._boundary = np.zeros(0, dtype=bool)
+        self._times = np.zeros(0)
+        self._steps = np.zeros(0)
+
+    def push(self, decoder, timestamp):
+        '''Append the decoder's current batch read at timestamp, returns the slots of
+        the revolutions it completed'''
+        n = decoder.count
+        if n == 0:
+            return []
+        if len(self._keep) < n:
+            self._keep = np.zeros(n, dtype=bool)
+            self._delta = np.zeros(n, dtype=np.int32)
+            self._boundary = np.zeros(n, dtype=bool)
+            self._times = np.zeros(n)
+            self._steps = np.arange(1, n + 1, dtype=float)
+
+        '''Sample i of n was read at previous + (i + 1) / n of the time since the previous batch'''
+        times = self._times[:n]
+        previous = timestamp if self.last_timestamp is None else self.last_timestamp
+        np.multiply(self._steps[:n], (timestamp - previous) / n, out=times)
+        times += previous
+        self.last_timestamp = timestamp
+
+        angle_q6 = decoder.angle_q6[:n]
+        keep = self._keep[:n]
+        delta = self._delta[:n]
+        boundary = self._boundary[:n]
+
+        np.greater(decoder.distance_q2[:n], 0, out=keep)
+
+        '''A revolution starts on the start flag, or where the angle wraps around
+        on devices that never set it'''
+        if self.use_start_flag or decoder.start_flag[:n].any():
+            self.use_start_flag = True
+            boundary[:] = decoder.start_flag[:n]
+        else:
+            delta[0] = int(angle_q6[0]) - self.last_angle_q6
+            np.subtract(angle_q6[1:], angle_q6[:-1], out=delta[1:], dtype=np.int32)
+            np.less(delta, -HALF_TURN_Q6, out=boundary)
+        np.logical_and(boundary, decoder.valid[:n], out=boundary)
+        self.last_angle_q6 = int(angle_q6[-1])
+
+        finished = []
+        start = 0
+        for index in np.flatnonzero(boundary):
+            self._append(decoder, keep, start, index, times)
+            start = index
+            if self.length >= self.min_samples:
+                finished.append(self._finish(times[index]))
+        self._append(decoder, keep, start, n, times)
+        return finished
+
+    def put(self, angle_q6, distance_q2, quality, timestamp):
+        '''Store an already framed raw revolution in the next slot, dropping zero
+        distance samples from the scan like push() does, returns the slot'''
+        slot = self.slot
+        n = min(len(angle_q6), self.capacity)
+        self.raw_angle_q6[slot, :n] = angle_q6[:n]
+        self.raw_distance_q2[slot, :n] = distance_q2[:n]
+        self.raw_quality[slot, :n] = quality[:n]
+        self.raw_length = n
+
+        keep = self.raw_distance_q2[slot, :n] > 0
+        count = int(np.count_nonzero(keep))
+        records = self.pool.records[slot, :count]
+        np.compress(keep, self.raw_angle_q6[slot, :n], out=self.angle_q6[slot, :count])
+        np.compress(keep, self.raw_distance_q2[slot, :n], out=self.distance_q2[slot, :count])
+        np.compress(keep, self.raw_quality[slot, :n], out=records['quality'])
+        records['timestamp'] = timestamp
+        self.length = count
+        return self._finish(timestamp)
+
+    def scan(self, slot):
+        '''LidarScan of a finished slot'''
+        return self.pool.scan(slot, self.lengths[slot], self.timestamps[slot])
+
+    def raw(self, slot):
+        '''(angle_q6, distance_q2, quality) of every sample of a finished slot, dropouts included'''
+        n = self.raw_lengths[slot]
+        return self.raw_angle_q6[slot, :n], self.raw_distance_q2[slot, :n], self.raw_quality[slot, :n]
+
+    def _append(self, decoder, keep, start, end, times):
+        if start == end:
+            return
+        raw_count = min(end - start, self.capacity - self.raw_length)
+        raw = slice(self.raw_length, self.raw_length + raw_count)
+        self.raw_angle_q6[self.slot, raw] = decoder.angle_q6[start:start + raw_count]
+        self.raw_distance_q2[self.slot, raw] = decoder.distance_q2[start:start + raw_count]
+        self.raw_quality[self.slot, raw] = decoder.quality[start:start + raw_count]
+        self.raw_length += raw_count
+
+        mask = keep[start:end]
+        count = min(int(np.count_nonzero(mask)), self.capacity - self.length)
+        if count == 0:
+            return
+        if count < np.count_nonzero(mask):
+            self.overflow_count += 1
+            mask = mask.copy()
+            mask[np.flatnonzero(mask)[count:]] = False
+
+        dst = slice(self.length, self.length + count)
+        np.compress(mask, decoder.angle_q6[start:end], out=self.angle_q6[self.slot, dst])
+        np.compress(mask, decoder.distance_q2[start:end], out=self.distance_q2[self.slot, dst])
+        records = self.pool.records[self.slot, dst]
+        np.compress(mask, decoder.quality[start:end], out=records['quality'])
+        np.compress(mask, times[start:end], out=records['timestamp'])
+        self.length += count
+
+    def _finish(self, timestamp):
+        slot, n = self.slot, self.length
+        records = self.pool.records[slot, :n]
+        angles = records['angle']
+        distances = records['distance']
+        x = records['x']
+        y = records['y']
+
+        np.divide(self.angle_q6[slot, :n], ANGLE_Q6_SCALE, out=angles)
+        np.divide(self.distance_q2[slot, :n], DISTANCE_Q2_SCALE, out=distances)
+        polar_to_cartesian(self.angle_q6[slot, :n], distances, x, y)
+
+        self.lengths[slot] = n
+        self.raw_lengths[slot] = self.raw_length
+        self.timestamps[slot] = timestamp
+        self.slot = (self.slot + 1) % self.slots
+        self.length = 0
+        self.raw_length = 0
+        return slot
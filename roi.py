@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class RoiPlanner:
+    '''Turns the lidar sectors that hold something closer than threshold (cm)
+    into the image column bands worth running detection on, mapped through
+    the CameraModel. Adjacent occupied sectors are merged and every band is
+    widened by margin (a fraction of the image width) so objects straddling a
+    sector edge are not cut in half.'''
+
+    def __init__(self, layout, camera, threshold, margin=0.03):
+        self.layout = layout
+        self.camera = camera
+        self.threshold = threshold
+        self.margin = margin
+
+    def columns(self, relative_bearings, image_width):
+        '''Image column of bearings relative to the camera axis'''
+        return self.camera.column(relative_bearings) * (image_width / self.camera.image_width)
+
+    def bands(self, stats, image_width):
+        '''List of (x0, x1) full resolution column ranges, empty when nothing is close'''
+        occupied = (stats.count > 0) & (np.nan_to_num(stats.min_distance, nan=np.inf) < self.threshold)
+        if not occupied.any():
+            return []
+
+        steps = np.diff(np.concatenate(([0], occupied.astype(np.int8), [0])))
+        starts = np.flatnonzero(steps == 1)
+        ends = np.flatnonzero(steps == -1)
+        pad = self.margin * image_width
+        left = np.clip(self.columns(self.layout.relative_edges[starts], image_width) - pad, 0, image_width)
+        right = np.clip(self.columns(self.layout.relative_edges[ends], image_width) + pad, 0, image_width)
+
+        bands = []
+        for x0, x1 in zip(left.astype(int).tolist(), np.ceil(right).astype(int).tolist()):
+            if bands and x0 <= bands[-1][1]:
+                bands[-1] = (bands[-1][0], max(bands[-1][1], x1))
+            elif x1 > x0:
+                bands.append((x0, x1))
+        return bands
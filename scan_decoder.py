@@ -0,0 +1,98 @@
+import time
+import numpy as np
+
+# Raw RPLidar scan response: one 5 byte packet per measurement
+#   byte 0    : quality (6 bits) | ~start_flag | start_flag
+#   byte 1..2 : angle_q6 (15 bits) << 1 | check bit (always 1)
+#   byte 3..4 : distance_q2 (distance in mm * 4)
+PACKET_SIZE = 5
+PACKET_DTYPE = np.dtype([('flags', 'u1'), ('angle', '<u2'), ('distance_q2', '<u2')])
+
+ANGLE_Q6_SCALE = 64.0  # angle_q6 / 64 -> degrees
+DISTANCE_Q2_SCALE = 40.0  # distance_q2 / 4 -> mm, / 10 -> cm
+
+
+class ScanDecoder:
+    '''Decodes raw scan packets straight from the serial port into preallocated
+    NumPy buffers, one batch at a time. The buffers are reused on every call, so
+    callers have to copy out whatever they want to keep before the next batch.'''
+
+    def __init__(self, batch_size=256):
+        self.batch_size = batch_size
+        self.count = 0
+        self.desync_count = 0
+        self.decode_time = 0.0
+
+        self.quality = np.zeros(batch_size, dtype=np.uint8)
+        self.start_flag = np.zeros(batch_size, dtype=bool)
+        self.angle_q6 = np.zeros(batch_size, dtype=np.uint16)
+        self.distance_q2 = np.zeros(batch_size, dtype=np.uint16)
+        self.valid = np.zeros(batch_size, dtype=bool)
+
+        '''Scratch buffers so decoding a batch does not allocate'''
+        self._scratch_u1 = np.zeros(batch_size, dtype=np.uint8)
+        self._scratch_u2 = np.zeros(batch_size, dtype=np.uint16)
+
+    def read(self, serial):
+        '''Read and decode one batch from a PyRPlidarSerial (or anything with receive_data)'''
+        raw = serial.receive_data(self.batch_size * PACKET_SIZE)
+        start = time.perf_counter()
+        n = self.decode(raw)
+        self.decode_time = time.perf_counter() - start
+
+        '''Drop a byte so the next batch lines up with the packet boundaries again'''
+        if self.misaligned():
+            self.desync_count += 1
+            serial.receive_data(1)
+        return n
+
+    def misaligned(self):
+        '''True when most of the current batch fails the packet checks, which means
+        we are reading across packet boundaries'''
+        n = self.count
+        return n > 0 and np.count_nonzero(self.valid[:n]) < n // 2
+
+    def decode(self, raw):
+        '''Decode as many whole packets as raw holds, returns the number decoded'''
+        n = min(len(raw) // PACKET_SIZE, self.batch_size)
+        self.count = n
+        if n == 0:
+            return 0
+
+        packets = np.frombuffer(raw, dtype=PACKET_DTYPE, count=n)
+        flags = packets['flags']
+        angle = packets['angle']
+
+        quality = self.quality[:n]
+        start_flag = self.start_flag[:n]
+        angle_q6 = self.angle_q6[:n]
+        distance_q2 = self.distance_q2[:n]
+        valid = self.valid[:n]
+        scratch_u1 = self._scratch_u1[:n]
+        scratch_u2 = self._scratch_u2[:n]
+
+        np.right_shift(flags, 2, out=quality)
+        np.bitwise_and(flags, 1, out=scratch_u1)
+        np.not_equal(scratch_u1, 0, out=start_flag)
+        np.right_shift(angle, 1, out=angle_q6)
+        distance_q2[:] = packets['distance_q2']
+
+        '''A packet is valid when start_flag != ~start_flag and the check bit is set'''
+        np.right_shift(flags, 1, out=scratch_u1)
+        np.bitwise_xor(scratch_u1, flags, out=scratch_u1)
+        np.bitwise_and(scratch_u1, 1, out=scratch_u1)
+        np.not_equal(scratch_u1, 0, out=valid)
+        np.bitwise_and(angle, 1, out=scratch_u2)
+        np.logical_and(valid, scratch_u2, out=valid)
+
+        '''Zero the distance of invalid packets so they fall out with the distance > 0 filter'''
+        np.multiply(distance_q2, valid, out=distance_q2)
+        return n
+
+    def angles(self, out=None):
+        '''Angles of the current batch in degrees'''
+        return np.divide(self.angle_q6[:self.count], ANGLE_Q6_SCALE, out=out, dtype=np.float64)
+
+    def distances(self, out=None):
+        '''Distances of the current batch in cm'''
+        return np.divide(self.distance_q2[:self.count], DISTANCE_Q2_SCALE, out=out, dtype=np.float64)
@@ -0,0 +1,152 @@
+import os
+import time
+import argparse
+import numpy as np
+from PySide6 import QtCore
+from revolution_buffer import RevolutionBuffer
+from lidar_stats import AcquisitionStats
+
+# Scan log layout: a 16 byte header followed by fixed width revolution records,
+# so the whole file can be mapped with np.memmap and indexed by revolution.
+SCAN_LOG_MAGIC = b'RPSCANLG'
+SCAN_LOG_VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('capacity', '<u4')])
+
+
+def record_dtype(capacity):
+    '''One revolution: wall clock timestamp, sample count and raw samples padded to capacity'''
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('count', '<u4'),
+        ('angle_q6', '<u2', (capacity,)),
+        ('distance_q2', '<u2', (capacity,)),
+        ('quality', 'u1', (capacity,)),
+    ])
+
+
+def open_scan_log(path):
+    '''Memory map a scan log, returns the record array (one row per revolution)'''
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header['magic'][0] != SCAN_LOG_MAGIC:
+        raise ValueError(f"{path} is not a scan log")
+    if header['version'][0] != SCAN_LOG_VERSION:
+        raise ValueError(f"Unsupported scan log version {header['version'][0]}")
+
+    dtype = record_dtype(int(header['capacity'][0]))
+    '''Ignore a trailing partial record left behind by an interrupted recording'''
+    count = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+
+class ScanLogWriter:
+    '''Appends revolutions to a scan log, creating it (and its header) if needed'''
+
+    def __init__(self, path, capacity=2048):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+            if header['magic'][0] != SCAN_LOG_MAGIC:
+                raise ValueError(f"{path} is not a scan log")
+            capacity = int(header['capacity'][0])
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+            header = np.zeros(1, dtype=HEADER_DTYPE)
+            header['magic'] = SCAN_LOG_MAGIC
+            header['version'] = SCAN_LOG_VERSION
+            header['capacity'] = capacity
+            self.file.write(header.tobytes())
+
+        self.capacity = capacity
+        self.record = np.zeros(1, dtype=record_dtype(capacity))
+
+    def write(self, timestamp, angle_q6, distance_q2, quality):
+        n = min(len(angle_q6), self.capacity)
+        record = self.record[0]
+        record['timestamp'] = timestamp
+        record['count'] = n
+        record['angle_q6'][:n] = angle_q6[:n]
+        record['distance_q2'][:n] = distance_q2[:n]
+        record['quality'][:n] = quality[:n]
+        record['angle_q6'][n:] = 0
+        record['distance_q2'][n:] = 0
+        record['quality'][n:] = 0
+        self.file.write(self.record.tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayLidarSource(QtCore.QThread):
+    '''Stand-in for LidarThread that plays back a scan log.
+
+    speed scales the recorded revolution timing: 1.0 is real time, 4.0 four
+    times faster, and 0 replays as fast as the consumer can take it.'''
+    new_data = QtCore.Signal(object)
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.stop_flag = False
+        self.records = open_scan_log(path)
+        self.revolutions = RevolutionBuffer(capacity=self.records.dtype['angle_q6'].shape[0])
+        self.stats = AcquisitionStats()
+
+    def run(self):
+        while not self.stop_flag:
+            self.replay()
+            if not self.loop or len(self.records) == 0:
+                break
+
+    def replay(self):
+        if len(self.records) == 0:
+            return
+        start_wall = time.monotonic()
+        start_log = self.records['timestamp'][0]
+
+        for record in self.records:
+            if self.stop_flag:
+                break
+            if self.speed > 0:
+                delay = (record['timestamp'] - start_log) / self.speed - (time.monotonic() - start_wall)
+                if delay > 0:
+                    time.sleep(delay)
+
+            n = record['count']
+            timestamp = time.monotonic()
+            '''Decode time is the conversion of the logged raw fields into the scan arrays'''
+            start = time.perf_counter()
+            distance_q2 = record['distance_q2'][:n]
+            slot = self.revolutions.put(record['angle_q6'][:n], distance_q2, record['quality'][:n], timestamp)
+            decode_time = time.perf_counter() - start
+            self.stats.record_batch(n, n - int(np.count_nonzero(distance_q2)), decode_time)
+            self.stats.record_revolution(timestamp)
+            self.new_data.emit(self.revolutions.scan(slot))
+
+    def consumed(self):
+        '''Every revolution is emitted as it completes, there is nothing to hand back'''
+        pass
+
+    def stop(self):
+        self.stop_flag = True
+        self.wait()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay a lidar scan log headless')
+    parser.add_argument("path", help="Scan log to replay.")
+    parser.add_argument("--speed", help="Replay speed, 0 for as fast as possible.", type=float, default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    source = ReplayLidarSource(args.path, speed=args.speed)
+    start_time = time.perf_counter()
+    source.run()
+    total_time = time.perf_counter() - start_time
+    total = len(source.records)
+    print(f"Replayed {total} revolutions in {total_time:.3f} s ({total / max(total_time, 1e-9):.0f} revolutions/s)")
@@ -0,0 +1,81 @@
+import threading
+import numpy as np
+from lidar_stats import LatencyHistogram
+
+
+class ScanSync:
+    '''Recent revolutions by timestamp, for pairing each camera frame with the
+    lidar data of the same moment.
+
+    Revolutions come in with their monotonic timestamp and are kept, in order,
+    in a ring of capacity entries; one older than the newest entry is rejected.
+    pair() finds the entries either side of a frame time by binary search over
+    the ring, O(log capacity) and without allocating. The ring holds references
+    only, so capacity must stay below the number of scan pool slots of the
+    lidar source or the oldest entries would be overwritten under it.
+
+    skew is the nearest revolution's timestamp minus the frame's, negative when
+    the lidar data is older; its magnitude goes into a histogram.'''
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)
+        self.entries = [None] * capacity
+        self.start = 0
+        self.count = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.skew = LatencyHistogram()
+        self.last_skew = float('nan')
+
+    def put(self, timestamp, entry):
+        with self.lock:
+            if self.count and timestamp <= self.timestamps[(self.start + self.count - 1) % self.capacity]:
+                self.rejected += 1
+                return
+            if self.count == self.capacity:
+                i = self.start
+                self.start = (self.start + 1) % self.capacity
+            else:
+                i = (self.start + self.count) % self.capacity
+                self.count += 1
+            self.timestamps[i] = timestamp
+            self.entries[i] = entry
+
+    def _after(self, timestamp):
+        '''Ring position of the first entry newer than timestamp, count when there is none'''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[(self.start + mid) % self.capacity] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def pair(self, timestamp):
+        '''(before, after, weight, skew) for a frame at timestamp: the newest entry at
+        or before it and the oldest one after it (either can be None), the weight of
+        after for interpolating between the two, and the skew of the nearer one'''
+        with self.lock:
+            if self.count == 0:
+                return None, None, 0.0, float('nan')
+            n = self._after(timestamp)
+            before = after = None
+            if n > 0:
+                i = (self.start + n - 1) % self.capacity
+                before, before_time = self.entries[i], float(self.timestamps[i])
+            if n < self.count:
+                i = (self.start + n) % self.capacity
+                after, after_time = self.entries[i], float(self.timestamps[i])
+
+        if before is None:
+            weight, skew = 1.0, after_time - timestamp
+        elif after is None:
+            weight, skew = 0.0, before_time - timestamp
+        else:
+            weight = (timestamp - before_time) / (after_time - before_time)
+            skew = before_time - timestamp if weight <= 0.5 else after_time - timestamp
+        self.last_skew = skew
+        self.skew.record(abs(skew))
+        return before, after, weight, skew
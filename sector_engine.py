@@ -0,0 +1,102 @@
+import numpy as np
+from scan_decoder import ANGLE_Q6_SCALE
+from lidar_geometry import Q6_TABLE_SIZE
+
+
+class SectorLayout:
+    '''Equal width sectors spanning the camera FOV, centred on the lidar
+    bearing the camera looks along (mount_yaw, degrees clockwise from the lidar
+    zero). Sector 0 is the leftmost one in the image.
+
+    The sector of every angle_q6 value is precomputed once, so assigning a
+    revolution to sectors is a single table lookup per sample whatever the
+    number of sectors.'''
+
+    def __init__(self, fov, num_sectors, mount_yaw=0.0):
+        self.fov = fov
+        self.num_sectors = num_sectors
+        self.mount_yaw = mount_yaw
+        self.width = fov / num_sectors
+
+        '''Sector edges and centres as lidar bearings in [0, 360)'''
+        relative_edges = np.linspace(-fov / 2, fov / 2, num_sectors + 1)
+        self.relative_edges = relative_edges
+        self.edges = (relative_edges + mount_yaw) % 360
+        self.centers = (relative_edges[:-1] + self.width / 2 + mount_yaw) % 360
+
+        bearings = np.arange(Q6_TABLE_SIZE) / ANGLE_Q6_SCALE
+        relative = (bearings - mount_yaw + 180) % 360 - 180
+        sector = np.floor((relative + fov / 2) / self.width).astype(np.int16)
+        sector[(sector < 0) | (sector >= num_sectors)] = -1
+        self.table = sector
+
+    def sector_index(self, angles):
+        '''Sector of each angle in degrees, -1 outside the FOV'''
+        return self.table[(angles * ANGLE_Q6_SCALE).astype(np.intp)]
+
+    def relative_bearing(self, angles):
+        '''Angles relative to the camera axis in [-180, 180), negative to the left'''
+        return (angles - self.mount_yaw + 180) % 360 - 180
+
+
+class SectorStats:
+    '''Per sector reduction of one revolution. Empty sectors have count 0 and
+    NaN for min_distance, min_x, min_y and mean_distance.'''
+
+    def __init__(self, num_sectors):
+        self.count = np.zeros(num_sectors, dtype=np.intp)
+        self.min_distance = np.full(num_sectors, np.nan)
+        self.min_x = np.full(num_sectors, np.nan)
+        self.min_y = np.full(num_sectors, np.nan)
+        self.mean_distance = np.full(num_sectors, np.nan)
+
+    def distance_values(self):
+        '''Closest distance per sector as a list, None for empty sectors'''
+        return [float(d) if c else None for d, c in zip(self.min_distance, self.count)]
+
+    def interpolate(self, before, after, weight):
+        '''Fill in place with before + weight * (after - before). Sectors empty
+        on one side take the other side's values, counts are the larger of the
+        two so a sector is empty only when it is empty on both sides.'''
+        for name in ('min_distance', 'min_x', 'min_y', 'mean_distance'):
+            out, a, b = getattr(self, name), getattr(before, name), getattr(after, name)
+            np.subtract(b, a, out=out)
+            out *= weight
+            out += a
+            np.copyto(out, b, where=before.count == 0)
+            np.copyto(out, a, where=after.count == 0)
+        np.maximum(before.count, after.count, out=self.count)
+        return self
+
+
+class SectorEngine:
+    '''Reduces a revolution to per sector closest point, count and mean in one
+    vectorized pass instead of a Python loop per sector'''
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.num_sectors = layout.num_sectors
+
+    def reduce(self, scan):
+        stats = SectorStats(self.num_sectors)
+        sector = self.layout.sector_index(scan.angle)
+        inside = np.flatnonzero(sector >= 0)
+        if len(inside) == 0:
+            return stats
+
+        sector = sector[inside]
+        distances = scan.distance[inside]
+        stats.count[:] = np.bincount(sector, minlength=self.num_sectors)
+        totals = np.bincount(sector, weights=distances, minlength=self.num_sectors)
+
+        '''Sorting by (sector, distance) puts every sector's closest point first in its run'''
+        order = np.lexsort((distances, sector))
+        occupied = stats.count > 0
+        run_starts = (np.cumsum(stats.count) - stats.count)[occupied]
+        closest = order[run_starts]
+
+        stats.min_distance[occupied] = distances[closest]
+        stats.min_x[occupied] = scan.x[inside[closest]]
+        stats.min_y[occupied] = scan.y[inside[closest]]
+        stats.mean_distance[occupied] = totals[occupied] / stats.count[occupied]
+        return stats
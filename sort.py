@@ -20,11 +20,6 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 from scipy.optimize import linear_sum_assignment
 
 # import lap
@@ -121,6 +116,7 @@ class KalmanBoxTracker(object):
     self.kf.Q[4:,4:] *= 0.01
 
     self.kf.x[:4] = convert_bbox_to_z(bbox)
+    self.detection = np.array(bbox) #last associated detection row, keeps score and any extra columns
     self.time_since_update = 0
     self.id = KalmanBoxTracker.count
     KalmanBoxTracker.count += 1
@@ -137,6 +133,7 @@ class KalmanBoxTracker(object):
     self.history = []
     self.hits += 1
     self.hit_streak += 1
+    self.detection = np.array(bbox)
     self.kf.update(convert_bbox_to_z(bbox))
 
   def predict(self):
@@ -153,6 +150,16 @@ class KalmanBoxTracker(object):
     self.history.append(convert_x_to_bbox(self.kf.x))
     return self.history[-1]
 
+  def extrapolate(self):
+    """
+    Advances the state vector for a frame that was not run through the detector.
+    Unlike predict() the frame does not count as a missed detection.
+    """
+    if((self.kf.x[6]+self.kf.x[2])<=0):
+      self.kf.x[6] *= 0.0
+    self.kf.predict()
+    return convert_x_to_bbox(self.kf.x)
+
   def get_state(self):
     """
     Returns the current bounding box estimate.
@@ -160,9 +167,128 @@ class KalmanBoxTracker(object):
     return convert_x_to_bbox(self.kf.x)
 
 
-def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
+class FusedKalmanBoxTracker(object):
+  """
+  KalmanBoxTracker with the object's lidar range in the state: [x,y,s,r,vx,vy,vs,d,vd].
+  The box part is the same constant velocity model in frames, the range part a constant
+  velocity model in seconds (d in cm, vd in cm/s, negative when approaching), so the
+  caller passes the time since the previous frame. Range measurements are optional,
+  without them the range is only predicted.
+  All matrices are allocated once per track, updates never change their size.
+  """
+  range_noise = 10.**2 #cm^2, lidar noise plus the spread of the closest return inside a box
+  range_accel = 200.**2 #(cm/s^2)^2, how hard objects change speed
+
+  def __init__(self,bbox,distance=np.nan):
+    """
+    Initialises a tracker using initial bounding box and, if known, range.
+    """
+    self.x = np.zeros((9,1))
+    self.F = np.eye(9)
+    self.F[0,4] = self.F[1,5] = self.F[2,6] = 1.
+    self.H = np.zeros((4,9))
+    self.H[:,:4] = np.eye(4)
+    self.R = np.diag([1.,1.,10.,10.])
+    self.Q = np.diag([1.,1.,1.,1.,.01,.01,.0001,0.,0.])
+    self.P = np.diag([10.,10.,10.,10.,1e4,1e4,1e4,1e8,1e6])
+    self.I = np.eye(9)
+
+    self.x[:4] = convert_bbox_to_z(bbox)
+    self.has_range = False
+    if np.isfinite(distance):
+      self.update_range(distance)
+    self.detection = np.array(bbox)
+    self.time_since_update = 0
+    self.id = KalmanBoxTracker.count
+    KalmanBoxTracker.count += 1
+    self.history = []
+    self.hits = 0
+    self.hit_streak = 0
+    self.age = 0
+
+  @property
+  def range(self):
+    return float(self.x[7,0]) if self.has_range else np.nan
+
+  @property
+  def range_rate(self):
+    return float(self.x[8,0]) if self.has_range else np.nan
+
+  def _predict(self,dt):
+    if((self.x[6]+self.x[2])<=0):
+      self.x[6] *= 0.0
+    self.F[7,8] = dt
+    self.Q[7,7] = self.range_accel * dt**3 / 3.
+    self.Q[7,8] = self.Q[8,7] = self.range_accel * dt**2 / 2.
+    self.Q[8,8] = self.range_accel * dt
+    self.x = self.F @ self.x
+    self.P = self.F @ self.P @ self.F.T + self.Q
+
+  def update(self,bbox,distance=np.nan):
+    """
+    Updates the state vector with observed bbox and, if finite, range.
+    """
+    self.time_since_update = 0
+    self.history = []
+    self.hits += 1
+    self.hit_streak += 1
+    self.detection = np.array(bbox)
+    y = convert_bbox_to_z(bbox) - self.H @ self.x
+    PHT = self.P @ self.H.T
+    K = PHT @ np.linalg.inv(self.H @ PHT + self.R)
+    self.x += K @ y
+    self.P = (self.I - K @ self.H) @ self.P
+    if np.isfinite(distance):
+      self.update_range(distance)
+
+  def update_range(self,distance):
+    """
+    Updates the state vector with an observed range only, H is the unit row picking d.
+    """
+    if not self.has_range:
+      self.x[7] = distance
+      self.x[8] = 0.
+      self.P[7,:] = self.P[:,7] = 0.
+      self.P[8,:] = self.P[:,8] = 0.
+      self.P[7,7] = self.range_noise
+      self.P[8,8] = 1e6
+      self.has_range = True
+      return
+    S = self.P[7,7] + self.range_noise
+    K = self.P[:,7:8] / S
+    self.x += K * (distance - self.x[7,0])
+    self.P -= K @ self.P[7:8,:]
+
+  def predict(self,dt=1.):
+    """
+    Advances the state vector and returns the predicted bounding box estimate.
+    """
+    self._predict(dt)
+    self.age += 1
+    if(self.time_since_update>0):
+      self.hit_streak = 0
+    self.time_since_update += 1
+    self.history.append(convert_x_to_bbox(self.x))
+    return self.history[-1]
+
+  def extrapolate(self,dt=1.):
+    """
+    Advances the state vector for a frame that was not run through the detector.
+    """
+    self._predict(dt)
+    return convert_x_to_bbox(self.x)
+
+  def get_state(self):
+    """
+    Returns the current bounding box estimate.
+    """
+    return convert_x_to_bbox(self.x)
+
+
+def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3,gate = None):
   """
   Assigns detections to tracked object (both represented as bounding boxes)
+  gate, if given, is a detections x trackers boolean matrix of the pairs allowed to match
 
   Returns 3 lists of matches, unmatched_detections and unmatched_trackers
   """
@@ -170,6 +296,8 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
     return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
 
   iou_matrix = iou_batch(detections, trackers)
+  if gate is not None:
+    iou_matrix = np.where(gate, iou_matrix, 0.)
 
   if min(iou_matrix.shape) > 0:
     a = (iou_matrix > iou_threshold).astype(np.int32)
@@ -206,20 +334,28 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
 
 
 class Sort(object):
-  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, fused=False, range_gate=100.):
     """
     Sets key parameters for SORT
+    With fused, tracks are FusedKalmanBoxTrackers and a detection whose range differs from
+    a track's predicted range by more than range_gate cannot match it.
     """
     self.max_age = max_age
     self.min_hits = min_hits
     self.iou_threshold = iou_threshold
+    self.fused = fused
+    self.range_gate = range_gate
     self.trackers = []
     self.frame_count = 0
+    self.match_ratio = 1.0
+    self.tentative = 0
 
-  def update(self, dets=np.empty((0, 5))):
+  def update(self, dets=np.empty((0, 5)), ranges=None, dt=1.):
     """
     Params:
       dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+      ranges - fused mode only, lidar range of every detection (NaN when unknown)
+      dt - fused mode only, seconds since the previous frame
     Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
     Returns the a similar array, where the last column is the object ID.
 
@@ -231,28 +367,43 @@ class Sort(object):
     to_del = []
     ret = []
     for t, trk in enumerate(trks):
-      pos = self.trackers[t].predict()[0]
+      pos = (self.trackers[t].predict(dt) if self.fused else self.trackers[t].predict())[0]
       trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
       if np.any(np.isnan(pos)):
         to_del.append(t)
     trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
     for t in reversed(to_del):
       self.trackers.pop(t)
-    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
+    if self.fused and ranges is None:
+      ranges = np.full(len(dets), np.nan)
+    gate = None
+    if self.fused and len(trks) > 0:
+      predicted = np.array([trk.range for trk in self.trackers])
+      with np.errstate(invalid='ignore'):
+        gate = ~(np.abs(ranges[:, None] - predicted[None, :]) > self.range_gate)
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold, gate)
+    # unmatched detections count against the ratio too, a new object means the tracks are stale
+    self.match_ratio = len(matched) / max(len(trks), len(dets)) if max(len(trks), len(dets)) > 0 else 1.0
 
     # update matched trackers with assigned detections
     for m in matched:
-      self.trackers[m[1]].update(dets[m[0], :])
+      if self.fused:
+        self.trackers[m[1]].update(dets[m[0], :], ranges[m[0]])
+      else:
+        self.trackers[m[1]].update(dets[m[0], :])
 
     # create and initialise new trackers for unmatched detections
     for i in unmatched_dets:
-        trk = KalmanBoxTracker(dets[i,:])
+        trk = FusedKalmanBoxTracker(dets[i,:], ranges[i]) if self.fused else KalmanBoxTracker(dets[i,:])
         self.trackers.append(trk)
     i = len(self.trackers)
+    self.tentative = 0
     for trk in reversed(self.trackers):
         d = trk.get_state()[0]
         if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
           ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1)) # +1 as MOT benchmark requires positive
+        elif trk.time_since_update < 1:
+          self.tentative += 1 # matched this frame but not shown until it has min_hits
         i -= 1
         # remove dead tracklet
         if(trk.time_since_update > self.max_age):
@@ -261,6 +412,33 @@ class Sort(object):
       return np.concatenate(ret)
     return np.empty((0,5))
 
+  def predict(self, dt=1.):
+    """
+    Advances every track one frame without detections, for frames the detector skips.
+    Returns the same array as update(). Skipped frames do not age tracks, so max_age
+    and min_hits keep counting detector frames only.
+    """
+    ret = []
+    for trk in self.trackers:
+      d = (trk.extrapolate(dt) if self.fused else trk.extrapolate())[0]
+      if np.any(np.isnan(d)):
+        continue
+      if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+        ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1))
+    if(len(ret)>0):
+      return np.concatenate(ret)
+    return np.empty((0,5))
+
+  def update_ranges(self, ids, ranges):
+    """
+    Fused mode only: feeds lidar ranges to the tracks with the given IDs (as returned by
+    update() and predict()), for frames where ranges are measured but boxes are not.
+    """
+    distances = {int(i): r for i, r in zip(ids, ranges) if np.isfinite(r)}
+    for trk in self.trackers:
+      if trk.id+1 in distances:
+        trk.update_range(distances[trk.id+1])
+
 def parse_args():
     """Parse input arguments."""
     parser = argparse.ArgumentParser(description='SORT demo')
@@ -279,6 +457,12 @@ def parse_args():
 
 if __name__ == '__main__':
   # all train
+  import matplotlib
+  matplotlib.use('TkAgg')
+  import matplotlib.pyplot as plt
+  import matplotlib.patches as patches
+  from skimage import io
+
   args = parse_args()
   display = args.display
   phase = args.phase
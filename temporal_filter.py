@@ -0,0 +1,123 @@
+import numpy as np
+from lidar_scan import ScanPool
+
+
+class TemporalFilter:
+    '''Smooths distances over the last depth revolutions to hide single sample
+    dropouts and spikes.
+
+    Every revolution is resampled onto a fixed angular grid (closest return per
+    bin) and stored in a fixed (depth, bins) ring, so memory stays flat however
+    long the app runs. mode 'median' re-sorts a copy of the ring along the
+    depth axis every revolution, O(depth log depth) per bin. A sorted ring
+    kept up to date by removing the evicted value and inserting the new one
+    is O(depth) per bin, but takes a dozen NumPy passes where the sort takes
+    one and measured slower for depths up to 31, so it is not used. mode
+    'ewma' keeps an exponentially weighted estimate updated in O(bins). Bins
+    without a return in any of the last depth revolutions are dropped from
+    the output scan.'''
+
+    def __init__(self, depth=5, bins=720, mode='median', alpha=0.3, slots=8):
+        if mode not in ('median', 'ewma'):
+            raise ValueError(f"Unknown temporal filter mode {mode}")
+        self.depth = depth
+        self.bins = bins
+        self.mode = mode
+        self.alpha = alpha
+
+        self.ring = np.full((depth, bins), np.nan)
+        self.head = 0
+        self.estimate = np.full(bins, np.nan)
+        self.age = np.full(bins, depth, dtype=np.intp)
+
+        '''Bin centres and their geometry never change, compute them once'''
+        self.angles = (np.arange(bins) + 0.5) * (360.0 / bins)
+        self.sin = np.sin(np.radians(self.angles))
+        self.cos = np.cos(np.radians(self.angles))
+
+        self.pool = ScanPool(slots, bins)
+        self.slot = 0
+
+        self._sorted = np.empty((depth, bins))
+        self._missing = np.empty((depth, bins), dtype=bool)
+        self._count = np.empty(bins, dtype=np.intp)
+        self._valid = np.empty(bins, dtype=bool)
+        self._fresh = np.empty(bins, dtype=bool)
+        self._blend = np.empty(bins, dtype=bool)
+        self._stale = np.empty(bins, dtype=bool)
+        self._delta = np.empty(bins)
+        self._lower = np.empty(bins, dtype=np.intp)
+        self._upper = np.empty(bins, dtype=np.intp)
+        self._columns = np.arange(bins)
+
+    def update(self, scan):
+        '''Add a revolution and return the filtered revolution as a new LidarScan'''
+        row = self.ring[self.head]
+        row.fill(np.nan)
+        index = (scan.angle * (self.bins / 360.0)).astype(np.intp) % self.bins
+        np.fmin.at(row, index, scan.distance)
+        self.head = (self.head + 1) % self.depth
+
+        if self.mode == 'median':
+            filtered = self._median()
+        else:
+            filtered = self._ewma(row)
+        return self._emit(filtered, scan.timestamp)
+
+    def _median(self):
+        '''NaNs sort last, so the median of each column sits in the middle of its
+        first count rows'''
+        np.copyto(self._sorted, self.ring)
+        self._sorted.sort(axis=0)
+        np.isnan(self._sorted, out=self._missing)
+        np.subtract(self.depth, self._missing.sum(axis=0), out=self._count)
+
+        np.subtract(self._count, 1, out=self._lower)
+        np.maximum(self._lower, 0, out=self._lower)
+        np.floor_divide(self._lower, 2, out=self._lower)
+        np.floor_divide(self._count, 2, out=self._upper)
+        np.minimum(self._upper, self.depth - 1, out=self._upper)
+
+        median = self.estimate
+        np.add(self._sorted[self._lower, self._columns], self._sorted[self._upper, self._columns], out=median)
+        np.multiply(median, 0.5, out=median)
+        return median
+
+    def _ewma(self, row):
+        valid = self._valid
+        np.isnan(row, out=valid)
+        np.logical_not(valid, out=valid)
+
+        estimate = self.estimate
+        np.isnan(estimate, out=self._fresh)
+        np.logical_and(self._fresh, valid, out=self._fresh)
+        np.copyto(estimate, row, where=self._fresh)
+        np.logical_not(self._fresh, out=self._blend)
+        np.logical_and(self._blend, valid, out=self._blend)
+        np.subtract(row, estimate, out=self._delta)
+        np.multiply(self._delta, self.alpha, out=self._delta)
+        np.add(estimate, self._delta, out=estimate, where=self._blend)
+
+        self.age += 1
+        np.copyto(self.age, 0, where=valid)
+        np.greater_equal(self.age, self.depth, out=self._stale)
+        np.copyto(estimate, np.nan, where=self._stale)
+        return estimate
+
+    def _emit(self, filtered, timestamp):
+        np.isnan(filtered, out=self._valid)
+        np.logical_not(self._valid, out=self._valid)
+        n = int(np.count_nonzero(self._valid))
+
+        slot = self.slot
+        self.slot = (self.slot + 1) % self.pool.slots
+        records = self.pool.records[slot, :n]
+        np.compress(self._valid, filtered, out=records['distance'])
+        np.compress(self._valid, self.angles, out=records['angle'])
+        np.compress(self._valid, self.sin, out=records['x'])
+        np.compress(self._valid, self.cos, out=records['y'])
+        np.multiply(records['x'], records['distance'], out=records['x'])
+        np.multiply(records['y'], records['distance'], out=records['y'])
+        records['quality'] = 0
+        records['timestamp'] = timestamp
+        return self.pool.scan(slot, n, timestamp)
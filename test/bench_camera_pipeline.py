@@ -0,0 +1,85 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+import cv2 as cv
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from frame_sources import open_source
+from frame_pool import FramePool
+from preprocess import Letterbox, DisplayScaler
+from overlay import OverlayRenderer
+from detector import Detector
+
+DISPLAY_WIDTH = 600
+DISPLAY_HEIGHT = 450
+ACQUIRE_TIMEOUT = 5.0
+
+
+def bench(source, frames, detector):
+    '''Run every frame through the camera stages on one thread and time each stage'''
+    letterbox = Letterbox(detector.imgsz if detector else 640)
+    display_scaler = DisplayScaler(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+    overlay = OverlayRenderer(DISPLAY_WIDTH, DISPLAY_HEIGHT)
+    cv.rectangle(overlay.layer('bar'), (0, DISPLAY_HEIGHT - 50), (DISPLAY_WIDTH, DISPLAY_HEIGHT), (0, 255, 0, 255), -1)
+    stages = {'read': 0.0, 'letterbox': 0.0, 'detect': 0.0, 'display': 0.0, 'overlay': 0.0}
+
+    if not source.open():
+        raise SystemExit(f"Couldn't open {source}")
+    pool = None
+    count = 0
+    start = time.perf_counter()
+    while not frames or count < frames:
+        t0 = time.perf_counter()
+        buffer = None
+        if pool is not None:
+            buffer = pool.acquire(timeout=ACQUIRE_TIMEOUT)
+            if buffer is None:
+                raise SystemExit(f"No free frame buffer after {ACQUIRE_TIMEOUT} s, a frame was never released")
+        ret, frame = source.read(image=buffer)
+        if not ret:
+            break
+        if pool is None:
+            pool = FramePool(frame.shape, 1)
+        t1 = time.perf_counter()
+        model_input = letterbox(frame)
+        t2 = time.perf_counter()
+        detections = detector([model_input])[0] if detector else np.empty((0, 6), dtype=np.float32)
+        letterbox.map_boxes(detections)
+        t3 = time.perf_counter()
+        display = display_scaler(frame)
+        t4 = time.perf_counter()
+        overlay.blend(display)
+        for x1, y1, x2, y2 in detections[:, :4]:
+            box = display_scaler.to_display(x1, y1, x2, y2)
+            cv.rectangle(display, box[:2], box[2:], (0, 255, 0), 3)
+        t5 = time.perf_counter()
+        display_scaler.pool.release(display)
+        '''The source may return its own array instead of the buffer it was given'''
+        pool.release(frame if buffer is None else buffer)
+
+        for name, elapsed in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+            stages[name] += elapsed
+        count += 1
+    total = time.perf_counter() - start
+    source.release()
+    return count, total, stages
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Per stage throughput of the camera pipeline on recorded footage')
+    parser.add_argument("--source", help="Video file, image directory or 'synthetic'.", default='synthetic')
+    parser.add_argument("--frames", help="Frames to run, 0 for the whole source.", type=int, default=300)
+    parser.add_argument("--model", help="YOLO weights, the detect stage is skipped without them.", default=None)
+    parser.add_argument("--backend", choices=('torch', 'onnx', 'openvino'), default='torch')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    detector = Detector(args.model, args.backend).load() if args.model else None
+    count, total, stages = bench(open_source(args.source), args.frames, detector)
+    print(f"{count} frames from {args.source} in {total:.2f} s ({count / max(total, 1e-9):.1f} FPS)")
+    for name, elapsed in stages.items():
+        print(f"  {name:10s} {elapsed / max(count, 1) * 1000:8.2f} ms/frame")
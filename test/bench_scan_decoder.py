@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+import numpy as np
+from pyrplidar_protocol import PyRPlidarMeasurement
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from scan_decoder import ScanDecoder, PACKET_SIZE
+
+NUM_PACKETS = 100000
+BATCH_SIZE = 128
+
+
+def make_packets(n):
+    '''Synthetic scan packets, roughly one revolution every 400 samples'''
+    rng = np.random.default_rng(0)
+    angles_q6 = (np.arange(n) * (360 * 64 // 400)) % (360 * 64)
+    distances_q2 = rng.integers(0, 12000 * 4, n)
+    quality = rng.integers(0, 64, n)
+    start = np.diff(angles_q6, prepend=360 * 64) < 0
+
+    raw = np.zeros((n, PACKET_SIZE), dtype=np.uint8)
+    raw[:, 0] = (quality << 2) | ((~start & 1) << 1) | start
+    angle_field = (angles_q6 << 1) | 1
+    raw[:, 1] = angle_field & 0xFF
+    raw[:, 2] = angle_field >> 8
+    raw[:, 3] = distances_q2 & 0xFF
+    raw[:, 4] = distances_q2 >> 8
+    return raw.tobytes()
+
+
+def parse_scan(scan):
+    '''The str() and split parser LidarThread used before ScanDecoder'''
+    line = str(scan).replace('{', ' ').replace('}', ' ').split(',')
+    return float(line[2].split(':')[1]), float(line[3].split(':')[1]) / 10
+
+
+def bench_legacy(raw):
+    start = time.perf_counter()
+    for i in range(0, len(raw), PACKET_SIZE):
+        scan = PyRPlidarMeasurement(raw[i:i + PACKET_SIZE])
+        angle, distance = parse_scan(scan)
+    return time.perf_counter() - start
+
+
+def bench_decoder(raw):
+    decoder = ScanDecoder(BATCH_SIZE)
+    view = memoryview(raw)
+    step = BATCH_SIZE * PACKET_SIZE
+    start = time.perf_counter()
+    for i in range(0, len(raw), step):
+        decoder.decode(view[i:i + step])
+        angles = decoder.angles()
+        distances = decoder.distances()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    raw = make_packets(NUM_PACKETS)
+    legacy = bench_legacy(raw)
+    decoded = bench_decoder(raw)
+    print(f"str() parser : {legacy * 1e3:8.1f} ms  ({NUM_PACKETS / legacy:10.0f} samples/s)")
+    print(f"ScanDecoder  : {decoded * 1e3:8.1f} ms  ({NUM_PACKETS / decoded:10.0f} samples/s)")
+    print(f"Speedup      : {legacy / decoded:.1f}x")
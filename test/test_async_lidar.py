@@ -0,0 +1,38 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from fake_rplidar import FakeRPLidar
+from async_lidar import headless
+
+DURATION = 3
+BAUDRATE = 256000
+
+
+def test_fake_device():
+    '''headless() against the pseudo-terminal device: revolutions must arrive
+    at the fake's rate and the reader must shut the device down on the way out'''
+    device = FakeRPLidar(samples_per_revolution=400, revolutions_per_s=10.0).start()
+    try:
+        reader = asyncio.run(headless(device.port, BAUDRATE, DURATION))
+    finally:
+        device.close()
+
+    assert reader.queue.closed, "queue was not closed on shutdown"
+    assert not device.scanning, "device was not stopped on shutdown"
+    assert reader.stats.revolutions >= 5 * DURATION, f"only {reader.stats.revolutions} revolutions"
+    assert reader.stats.desyncs == 0, f"{reader.stats.desyncs} desyncs"
+    print(f"fake device: {reader.stats.revolutions} revolutions, {reader.stats.samples} samples")
+
+
+def test_missing_port():
+    '''A port that cannot be opened must end headless() instead of hanging it'''
+    reader = asyncio.run(headless('/dev/does-not-exist', BAUDRATE, DURATION))
+    assert reader.queue.closed, "queue was left open after a failed open"
+    print("missing port: reader stopped")
+
+
+if __name__ == '__main__':
+    test_fake_device()
+    test_missing_port()